@@ -1,8 +1,11 @@
 import os
 import dspy
 from dspy import Prediction
-from shared.config import configure_lm
+from shared.config import configure_lm, load_saved_state
 from shared.mcp_client import MockMCPClient
+from shared.llm_cache import DiskCache, cached_call
+from shared.file_cache import read_text
+from shared.log_compress import compress_logs
 
 
 class CICDLogAgent(dspy.Module):
@@ -11,15 +14,11 @@ class CICDLogAgent(dspy.Module):
     def __init__(self, mcp_client):
         super().__init__()
         self.mcp_client = mcp_client
+        self.cache = DiskCache()
 
-        # Step 1 → detect root cause + suggestions
-        self.analyze_failure = dspy.Predict(
-            "pipeline_logs -> root_cause: str, fix_suggestions: list[str]"
-        )
-
-        # Step 2 → estimate severity of impact
-        self.impact_estimate = dspy.Predict(
-            "root_cause -> impact_level: str"
+        # Single pass → root cause, suggestions and impact severity
+        self.analyze = dspy.Predict(
+            "pipeline_logs -> root_cause: str, fix_suggestions: list[str], impact_level: str"
         )
 
     def forward(self, pipeline_id: str) -> Prediction:
@@ -27,24 +26,23 @@ class CICDLogAgent(dspy.Module):
         print(f"\n🔍 Running CI/CD Failure Analysis for: {pipeline_id}")
 
         # Fetch mock logs
-        with open(os.path.join(os.path.dirname(__file__), "pipeline.log")) as f:
-            logs = f.read()
+        logs = read_text(os.path.join(os.path.dirname(__file__), "pipeline.log"))
+        logs = compress_logs(logs)
 
-        # Run predictors
-        analysis = self.analyze_failure(pipeline_logs=logs)
-        impact = self.impact_estimate(root_cause=analysis.root_cause)
+        # Run predictor (one LLM round trip)
+        analysis = cached_call(self.analyze, self.cache, pipeline_logs=logs)
 
         return dspy.Prediction(
             root_cause=analysis.root_cause,
             fix_suggestions=analysis.fix_suggestions,
-            impact_level=impact.impact_level
+            impact_level=analysis.impact_level
         )
 
 
 def run_cicd_agent():
     configure_lm()
     mcp_client = MockMCPClient()
-    agent = CICDLogAgent(mcp_client)
+    agent = load_saved_state(CICDLogAgent(mcp_client), "cicd_agent")
 
     result = agent("demo-pipeline-001")
 
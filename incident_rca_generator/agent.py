@@ -1,9 +1,11 @@
 import os
-import json
 import dspy
+import orjson
 from dspy import Prediction
-from shared.config import configure_lm
+from shared.config import configure_lm, load_saved_state
 from shared.mcp_client import MockMCPClient
+from shared.llm_cache import DiskCache, cached_call
+from shared.file_cache import read_text
 
 
 class InfraRCAGeneratorAgent(dspy.Module):
@@ -12,6 +14,7 @@ class InfraRCAGeneratorAgent(dspy.Module):
     def __init__(self, mcp_client):
         super().__init__()
         self.mcp_client = mcp_client
+        self.cache = DiskCache()
 
         # Predictor for infra incident context
         self.generate_rca = dspy.Predict(
@@ -20,10 +23,9 @@ class InfraRCAGeneratorAgent(dspy.Module):
 
     def forward(self, incident_path: str) -> Prediction:
 
-        with open(incident_path, "r") as f:
-            context = json.load(f)
+        context = orjson.loads(read_text(incident_path))
 
-        result = self.generate_rca(infra_context=json.dumps(context))
+        result = cached_call(self.generate_rca, self.cache, infra_context=orjson.dumps(context).decode())
 
         # Fallbacks
         root_cause = getattr(result, "root_cause", "Unable to determine root cause.")
@@ -44,7 +46,7 @@ class InfraRCAGeneratorAgent(dspy.Module):
 def run_rca_agent():
     configure_lm()
     mcp_client = MockMCPClient()
-    agent = InfraRCAGeneratorAgent(mcp_client)
+    agent = load_saved_state(InfraRCAGeneratorAgent(mcp_client), "rca_agent")
 
     incident_path = os.path.join(os.path.dirname(__file__), "alerts.json")
     result = agent(incident_path)
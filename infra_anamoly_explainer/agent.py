@@ -1,5 +1,6 @@
 import os
-import json
+import orjson
+from shared.file_cache import read_text
 
 THRESHOLDS = {
     "cpu": 85,
@@ -9,38 +10,34 @@ THRESHOLDS = {
 }
 
 def load_metrics(file_path):
-    with open(file_path) as f:
-        return json.load(f)
+    return orjson.loads(read_text(file_path))
+
+# metric → (finding template, probable cause, recommendation)
+CHECKS = [
+    ("cpu", "CPU usage {value}% exceeds {limit}%",
+     "Possible high workload or tight loop.", "Check top CPU pods; consider HPA scaling."),
+    ("memory", "Memory usage {value}% exceeds {limit}%",
+     "Memory leak or unbounded cache growth.", "Review memory limits; restart leaking pods."),
+    ("latency_ms", "High latency {value} ms",
+     "Network congestion or backend slowdown.", "Check downstream service response times."),
+    ("pod_restarts", "{value} pod restarts detected",
+     "CrashLoop or readiness probe failures.", "Inspect pod logs and readiness config."),
+]
+
+def breached_checks(metrics):
+    return [c for c in CHECKS if metrics.get(c[0], 0) > THRESHOLDS[c[0]]]
 
 def detect_anomalies(metrics):
-    findings = []
-    if metrics.get("cpu", 0) > THRESHOLDS["cpu"]:
-        findings.append(f"CPU usage {metrics['cpu']}% exceeds {THRESHOLDS['cpu']}%")
-    if metrics.get("memory", 0) > THRESHOLDS["memory"]:
-        findings.append(f"Memory usage {metrics['memory']}% exceeds {THRESHOLDS['memory']}%")
-    if metrics.get("latency_ms", 0) > THRESHOLDS["latency_ms"]:
-        findings.append(f"High latency {metrics['latency_ms']} ms")
-    if metrics.get("pod_restarts", 0) > THRESHOLDS["pod_restarts"]:
-        findings.append(f"{metrics['pod_restarts']} pod restarts detected")
-    return findings
+    return [msg.format(value=metrics[key], limit=THRESHOLDS[key])
+            for key, msg, _, _ in breached_checks(metrics)]
 
 def interpret(findings, metrics):
     if not findings:
         return ("Healthy", "System metrics are within normal thresholds.",
                 ["Continue monitoring periodically."])
-    causes, recos = [], []
-    if "CPU" in " ".join(findings):
-        causes.append("Possible high workload or tight loop.")
-        recos.append("Check top CPU pods; consider HPA scaling.")
-    if "Memory" in " ".join(findings):
-        causes.append("Memory leak or unbounded cache growth.")
-        recos.append("Review memory limits; restart leaking pods.")
-    if "latency" in " ".join(findings):
-        causes.append("Network congestion or backend slowdown.")
-        recos.append("Check downstream service response times.")
-    if "pod restarts" in " ".join(findings):
-        causes.append("CrashLoop or readiness probe failures.")
-        recos.append("Inspect pod logs and readiness config.")
+    hits = breached_checks(metrics)
+    causes = [cause for _, _, cause, _ in hits]
+    recos = [reco for _, _, _, reco in hits]
     return ("Unhealthy", " | ".join(causes), recos)
 
 def run_anomaly_agent():
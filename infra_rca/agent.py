@@ -7,20 +7,113 @@ Collects describe/events/logs/metrics → runs Gemini RCA → outputs Markdown.
 """
 
 import os
+import sys
 import asyncio
+import hashlib
+import logging
+import re
 from concurrent.futures import ThreadPoolExecutor
+import ahocorasick
 from utils.k8s_helper import K8sHelper
 from utils.metrics_client import MetricsClient
 from utils.markdown_helper import build_markdown_generic
 from utils.dspy_helper import InfraRCAHelper 
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.log_compress import compress_logs
+
+logger = logging.getLogger(__name__)
+
+# (lower-cased needle, signal label) pairs
+SIGNAL_PATTERNS = (
+    ("crashloopbackoff", "CrashLoopBackOff"),
+    ("back-off restarting", "CrashLoopBackOff"),
+    ("imagepullbackoff", "ImagePullBackOff"),
+    ("failed to pull image", "ImagePullBackOff"),
+    ("errimagepull", "ImagePullBackOff"),
+    ("oomkilled", "OOMKilled"),
+    ("memorypressure", "NodeMemoryPressure"),
+    ("diskpressure", "NodeDiskPressure"),
+    ("failedscheduling", "FailedScheduling"),
+    ("unschedulable", "FailedScheduling"),
+    ("evicted", "Evicted"),
+    ("node not ready", "NodeNotReady"),
+    ("dns", "DNSIssue"),
+    ("readinessprobe failed", "ProbeFailure"),
+    ("livenessprobe failed", "ProbeFailure"),
+    ("no such host", "DNSIssue"),
+    ("progressdeadlineexceeded", "FailedRollout"),
+    ("unavailable", "UnavailableReplicas"),
+    ("connection refused", "ServiceUnavailable"),
+    ("timeout", "TimeoutError"),
+    ("pod has unbound immediate persistentvolumeclaims", "PVCUnbound"),
+)
+
+# Report order for labels, computed once instead of sorting per call
+SIGNAL_LABELS = tuple(sorted({label for _, label in SIGNAL_PATTERNS}))
+
+# Aho–Corasick automaton built once at import and shared by every resource
+SIGNAL_AUTOMATON = ahocorasick.Automaton()
+for _needle, _label in SIGNAL_PATTERNS:
+    SIGNAL_AUTOMATON.add_word(_needle, _label)
+SIGNAL_AUTOMATON.make_automaton()
+
+# Any of these in events/logs means the resource is worth an LLM look
+TROUBLE_HINT = re.compile(r"error|fail|warn|crash", re.IGNORECASE)
+
+# Workload identity in describe output: container images, the owner in the
+# API YAML (ownerReferences) and in `kubectl describe` text (Controlled By)
+DESCRIBE_IDENTITY_RE = re.compile(
+    r"^[ \t-]*image:[ \t]*(\S+)"
+    r"|ownerReferences:[ \t]*\n(?:[ \t]+.*\n)*?[ \t]+name:[ \t]*(\S+)"
+    r"|^Controlled By:[ \t]*(\S+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+REPORT_FILE = "cluster_rca_report.md"
+REPORT_SEPARATOR = "\n\n-------------------------------------------------------\n\n"
+
+_agent = None
+
+
+def get_agent() -> "AgenticInfraRCA":
+    """Process-wide agent so K8s/metrics/Gemini clients are built once and reused."""
+    global _agent
+    if _agent is None:
+        _agent = AgenticInfraRCA()
+    return _agent
+
 
 class AgenticInfraRCA:
-    def __init__(self, max_workers: int = 6):
-        self.k8s = K8sHelper()
-        self.metrics = MetricsClient()
+    def __init__(self, max_workers: int = None, batch_size: int = 8, io_workers: int = 32, llm_concurrency: int = 8):
+        # work is I/O-bound (Gemini RTT), so size well past the CPU count
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)  # concurrent LLM (RCA) calls
+        self.io_workers = io_workers        # concurrent K8s/metrics collection calls
+        # each collect() fans out into 4 reads, so the fetch pool keeps up with every collect worker
+        self.k8s = K8sHelper(fetch_workers=io_workers * 4)
+        self.metrics = MetricsClient(custom_api=self.k8s.custom)
         self.rca = InfraRCAHelper()
-        self.max_workers = max_workers
+        self.llm_concurrency = llm_concurrency  # in-flight Gemini requests (avoids 429s)
+        # long-lived pools, reused across analyze_cluster calls
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rca")
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="collect")
+        self.batch_size = max(1, batch_size)
+        self.stats = {"dedup_hits": 0}
+
+    def close(self):
+        """Shut down the worker pools; a closed shared agent is dropped so get_agent() builds a fresh one."""
+        global _agent
+        if _agent is self:
+            _agent = None
+        self._io_pool.shutdown(wait=True)
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     # ------------------------------------------------------------------ #
     # Generic signal extractor (shared across all resource types)
@@ -28,55 +121,23 @@ class AgenticInfraRCA:
     def extract_signals(self, data: dict) -> str:
         """Extract common failure patterns from describe/events/logs."""
         text = " ".join(data.values()).lower()
-        patterns = {
-            "crashloopbackoff": "CrashLoopBackOff",
-            "back-off restarting": "CrashLoopBackOff",
-            "imagepullbackoff": "ImagePullBackOff",
-            "failed to pull image": "ImagePullBackOff",
-            "errimagepull": "ImagePullBackOff",
-            "oomkilled": "OOMKilled",
-            "memorypressure": "NodeMemoryPressure",
-            "diskpressure": "NodeDiskPressure",
-            "failedscheduling": "FailedScheduling",
-            "unschedulable": "FailedScheduling",
-            "evicted": "Evicted",
-            "node not ready": "NodeNotReady",
-            "dns": "DNSIssue",
-            "readinessprobe failed": "ProbeFailure",
-            "livenessprobe failed": "ProbeFailure",
-            "no such host": "DNSIssue",
-            "progressdeadlineexceeded": "FailedRollout",
-            "unavailable": "UnavailableReplicas",
-            "connection refused": "ServiceUnavailable",
-            "timeout": "TimeoutError",
-            "pod has unbound immediate persistentvolumeclaims": "PVCUnbound",
-        }
-        signals = {v for k, v in patterns.items() if k in text}
-        if not signals and any(tok in text for tok in ("error", "fail", "exception", "critical")):
-            signals.add("GeneralError")
-        return ", ".join(sorted(signals)) if signals else "None"
+        # single pass over the text for all patterns
+        signals = {label for _, label in SIGNAL_AUTOMATON.iter(text)}
+        if signals:
+            return ", ".join(label for label in SIGNAL_LABELS if label in signals)
+        if any(tok in text for tok in ("error", "fail", "exception", "critical")):
+            return "GeneralError"
+        return "None"
 
     # ------------------------------------------------------------------ #
-    # Analyze a single resource
+    # Collect data for a single resource
     # ------------------------------------------------------------------ #
-    def analyze_resource(self, kind: str, name: str, namespace: str = None):
+    def collect(self, kind: str, name: str, namespace: str = None):
         """
-        Collect K8s data, extract signals, run RCA reasoning and return structured result.
+        Collect K8s data, metrics summary and signals for one resource.
 
-        Returns:
-            None when nothing to analyze (empty resource),
-            otherwise a dict:
-            {
-                "kind": kind,
-                "name": name,
-                "namespace": namespace,
-                "root_cause": "...",
-                "reasoning": "...",
-                "recommendations": [...],
-                "patch_yaml": "...",
-                "category": "...",
-                "markdown": "full md report"
-            }
+        Returns None when there is nothing to analyze (empty resource), otherwise
+        a dict with kind/name/namespace, raw `data`, `metrics` and `signals`.
         """
         # 1) Collect K8s resource data
         data = self.k8s.collect_resource_data(kind, name, namespace)
@@ -95,25 +156,110 @@ class AgenticInfraRCA:
         # 3) Extract signals
         signals = self.extract_signals(data)
 
-        # 4) Run RCA reasoning (LLM)
-        diag = {}
+        return {
+            "kind": kind,
+            "name": name,
+            "namespace": namespace,
+            "data": data,
+            "metrics": metrics_summary,
+            "signals": signals,
+        }
+
+    async def collect_async(self, kind: str, name: str, namespace: str = None, executor=None):
+        """Awaitable `collect` so many resources can be collected concurrently."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.collect, kind, name, namespace)
+
+    @staticmethod
+    def fingerprint(item: dict):
+        """
+        Hash of the inputs that drive the RCA. Replicas of the same workload
+        (same owner and images) share it once their own name is masked out.
+        Returns None when events and logs are both empty: such resources are
+        only told apart by their describe output and are never merged.
+        """
+        data = item["data"]
+        if not data.get("events", "").strip() and not data.get("logs", "").strip():
+            return None
+        identity = sorted("".join(m) for m in DESCRIBE_IDENTITY_RE.findall(data.get("describe", "")))
+        blob = "\n".join((
+            item["kind"],
+            item["signals"],
+            " ".join(identity),
+            data.get("events", "")[:2000],
+            data.get("logs", "")[:2000],
+        )).replace(item["name"], "<name>")
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    @staticmethod
+    def _rca_inputs(item: dict) -> dict:
+        """Map a collected item onto InfraRCAHelper.run_rca keyword arguments."""
+        data = item["data"]
+        return {
+            "kind": item["kind"],
+            "name": item["name"],
+            "namespace": item["namespace"] or "",
+            "describe": data.get("describe", ""),
+            "events": compress_logs(data.get("events", "")),
+            "logs": compress_logs(data.get("logs", "")),
+            "metrics": item["metrics"],
+            "signals": item["signals"],
+        }
+
+    def _healthy_diag(self, item: dict):
+        """
+        Deterministic fast-path: no failure signals and no error tokens in
+        events/logs means there is nothing for the LLM to diagnose.
+        Signals are taken from events/logs only; describe YAML always carries
+        spec words like dnsPolicy or MemoryPressure and would never pass.
+        Returns a canned diagnosis, or None when RCA is needed.
+        """
+        data = item["data"]
+        runtime = {"events": data.get("events", ""), "logs": data.get("logs", "")}
+        if self.extract_signals(runtime) != "None":
+            return None
+        if TROUBLE_HINT.search(data.get("events", "")) or TROUBLE_HINT.search(data.get("logs", "")):
+            return None
+        return {
+            "root_cause": "No anomalies detected",
+            "reasoning": f"No error signals in {item['kind']}/{item['name']} events or logs; resource appears healthy.",
+            "recommendations": ["Continue monitoring."],
+            "patch_yaml": "",
+            "category": "Healthy",
+        }
+
+    def _run_rca(self, item: dict, on_partial=None) -> dict:
+        """Run RCA reasoning (LLM) for one collected item; never raises."""
         try:
-            diag = self.rca.run_rca(
-                kind=kind,
-                name=name,
-                namespace=namespace or "",
-                describe=data.get("describe", ""),
-                events=data.get("events", ""),
-                logs=data.get("logs", ""),
-                metrics=metrics_summary,
-                signals=signals,
-            ) or {}
+            return self.rca.run_rca(**self._rca_inputs(item), on_partial=on_partial) or {}
         except Exception as e:
             # Ensure diag is a dict even on error
-            print(f"❌ Error running RCA for {kind}/{name}: {e}")
-            diag = {}
+            logger.error(f"❌ Error running RCA for {item['kind']}/{item['name']}: {e}")
+            return {}
 
-        # 5) Extract fields safely with defaults
+    # ------------------------------------------------------------------ #
+    # Turn RCA output into the structured result + markdown
+    # ------------------------------------------------------------------ #
+    def build_result(self, item: dict, diag: dict) -> dict:
+        """
+        Returns a dict:
+            {
+                "kind": kind,
+                "name": name,
+                "namespace": namespace,
+                "root_cause": "...",
+                "reasoning": "...",
+                "recommendations": [...],
+                "patch_yaml": "...",
+                "category": "...",
+                "markdown": "full md report"
+            }
+        """
+        kind, name, namespace = item["kind"], item["name"], item["namespace"]
+        signals = item["signals"]
+        diag = diag or {}
+
+        # Extract fields safely with defaults
         root_cause = (diag.get("root_cause") or "").strip()
         reasoning = (diag.get("reasoning") or "").strip()
         recommendations = diag.get("recommendations") or []
@@ -140,11 +286,10 @@ class AgenticInfraRCA:
             else:
                 patch_yaml = "# No manifest change required."
 
-        # 6) Build markdown report
+        # Build markdown report
         md = build_markdown_generic(kind, name, namespace, root_cause, reasoning, recommendations, patch_yaml, category)
 
-        # 7) Build and return full structured result
-        result = {
+        return {
             "kind": kind,
             "name": name,
             "namespace": namespace,
@@ -156,20 +301,98 @@ class AgenticInfraRCA:
             "markdown": md,
         }
 
-        return result
+    # ------------------------------------------------------------------ #
+    # Analyze a single resource
+    # ------------------------------------------------------------------ #
+    def analyze_resource(self, kind: str, name: str, namespace: str = None, on_partial=None):
+        """
+        Collect K8s data, extract signals, run RCA reasoning and return structured result.
+        `on_partial(field, value)` is forwarded to the streaming RCA call.
+
+        Returns None when nothing to analyze (empty resource), otherwise the
+        dict described in `build_result`.
+        """
+        item = self.collect(kind, name, namespace)
+        if item is None:
+            return None
+        return self.build_result(item, self._healthy_diag(item) or self._run_rca(item, on_partial))
+
+    def analyze_resources(self, targets: list) -> list:
+        """
+        Collect several (kind, name, namespace) targets concurrently and analyze
+        them with one batched RCA call. Returns results aligned with `targets`
+        (None where there is nothing to analyze).
+        """
+        collected = list(self._io_pool.map(lambda t: self.collect(*t), targets))
+        present = [i for i, it in enumerate(collected) if it is not None]
+        results = [None] * len(targets)
+        for i, res in zip(present, self.analyze_batch([collected[i] for i in present])):
+            results[i] = res
+        return results
+
+    # ------------------------------------------------------------------ #
+    # Analyze a batch of collected resources with one LLM call
+    # ------------------------------------------------------------------ #
+    def analyze_batch(self, items: list) -> list:
+        """
+        Run RCA for already-collected items in a single Gemini request.
+        Healthy items skip the LLM entirely; items the batch response does
+        not cover fall back to per-resource RCA.
+        """
+        return [self.build_result(item, diag) for item, diag in zip(items, self.diagnose_batch(items))]
+
+    def diagnose_batch(self, items: list) -> list:
+        """Raw RCA diagnoses (before build_result fallbacks) aligned with `items`."""
+        diags = [self._healthy_diag(it) for it in items]
+        pending = [i for i, d in enumerate(diags) if d is None]
+
+        if len(pending) == 1:
+            diags[pending[0]] = self._run_rca(items[pending[0]])
+        elif pending:
+            try:
+                batch = self.rca.run_rca_batch([self._rca_inputs(items[i]) for i in pending])
+            except Exception as e:
+                logger.error(f"❌ Batched RCA failed for {len(pending)} resources: {e}")
+                batch = [None] * len(pending)
+            for i, diag in zip(pending, batch):
+                diags[i] = diag or self._run_rca(items[i])
+        return diags
+
+    def _clone_diag(self, source: dict, other: dict, diag: dict) -> dict:
+        """
+        Reuse `source`'s diagnosis for a resource with the same fingerprint.
+        The fingerprint masks the resource name, so the name is swapped back
+        in; healthy members get their own canned diagnosis.
+        """
+        healthy = self._healthy_diag(other)
+        if healthy is not None:
+            return healthy
+
+        def rename(v):
+            if isinstance(v, str):
+                return v.replace(source["name"], other["name"])
+            if isinstance(v, list):
+                return [rename(x) for x in v]
+            return v
+
+        return {k: rename(v) for k, v in (diag or {}).items()}
 
 
     # ------------------------------------------------------------------ #
     # Cluster-wide RCA (async, entity-agnostic)
     # ------------------------------------------------------------------ #
     async def analyze_cluster(self, exclude_system=True, kinds=None):
-        """Scan cluster and analyze resources concurrently."""
+        """
+        Scan cluster and analyze resources concurrently.
+        Report sections are appended to REPORT_FILE as they complete; returns
+        the report path, or "" when nothing was analyzed.
+        """
         if kinds is None:
             kinds = ["Pod", "Node", "Deployment", "Service"]
 
         namespaces = self.k8s.list_namespaces(exclude_system)
         if not namespaces:
-            print("⚪ No namespaces found — cluster may be empty.")
+            logger.info("⚪ No namespaces found — cluster may be empty.")
             return ""
 
         resources = []
@@ -187,28 +410,71 @@ class AgenticInfraRCA:
                     resources.append((kind, name, ns))
 
         if not resources:
-            print("⚪ No analyzable resources found.")
+            logger.info("⚪ No analyzable resources found.")
             return ""
 
-        print("\n📊 Cluster Node Metrics:\n" + self.metrics.summarize_nodes() + "\n")
+        logger.info("\n📊 Cluster Node Metrics:\n" + self.metrics.summarize_nodes() + "\n")
+
+        loop = asyncio.get_running_loop()
+        written = 0
+
+        # Stream each report section to disk as soon as it is ready. Only this
+        # coroutine writes, so no lock is needed.
+        with open(REPORT_FILE, "w") as report:
 
-        loop = asyncio.get_event_loop()
-        results = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-            tasks = [loop.run_in_executor(pool, self.analyze_resource, k, n, ns) for k, n, ns in resources]
+            def write_part(md):
+                nonlocal written
+                report.write((REPORT_SEPARATOR if written else "") + md)
+                report.flush()
+                written += 1
+
+            # Phase 1: collect K8s data for every resource (I/O-bound, fanned out wide)
+            collected = []
+            tasks = [self.collect_async(k, n, ns, self._io_pool) for k, n, ns in resources]
             for res in await asyncio.gather(*tasks, return_exceptions=True):
                 if isinstance(res, Exception):
-                    results.append({"markdown": f"# ⚠️ Analyzer error: {res}"})
+                    write_part(f"# ⚠️ Analyzer error: {res}")
                 elif res is not None:
-                    results.append(res)
+                    collected.append(res)
+
+            # Group identical RCA inputs so each is reasoned about only once
+            groups, group_of = {}, {}
+            for item in collected:
+                key = self.fingerprint(item) or id(item)
+                group_of[id(item)] = groups.setdefault(key, [])
+                group_of[id(item)].append(item)
+            unique = [members[0] for members in groups.values()]
+            self.stats["dedup_hits"] += len(collected) - len(unique)
+            if len(unique) < len(collected):
+                logger.info(f"♻️ Deduplicated {len(collected)} resources → {len(unique)} unique RCA inputs")
+
+            # bound in-flight LLM work so the provider is not hammered into 429 retries
+            llm_sem = asyncio.Semaphore(self.llm_concurrency)
+
+            async def run_batch(batch):
+                async with llm_sem:
+                    return batch, await loop.run_in_executor(self._pool, self.diagnose_batch, batch)
+
+            # Phase 2: one LLM call per chunk of `batch_size` resources
+            batches = [unique[i:i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+            tasks = [run_batch(b) for b in batches]
+            for fut in asyncio.as_completed(tasks):
+                try:
+                    batch, diags = await fut
+                except Exception as e:
+                    write_part(f"# ⚠️ Analyzer error: {e}")
+                    continue
+                for item, diag in zip(batch, diags):
+                    write_part(self.build_result(item, diag)["markdown"])
+                    # clone the diagnosis onto the rest of the equivalence class,
+                    # rebuilding each report so it names its own resource
+                    for other in group_of[id(item)][1:]:
+                        write_part(self.build_result(other, self._clone_diag(item, other, diag))["markdown"])
 
-        report_parts = [r["markdown"] for r in results if "markdown" in r]
-        if not report_parts:
-            print("⚪ No meaningful RCA output generated.")
+        if not written:
+            logger.info("⚪ No meaningful RCA output generated.")
             return ""
 
-        final = "\n\n-------------------------------------------------------\n\n".join(report_parts)
-        with open("cluster_rca_report.md", "w") as f:
-            f.write(final)
-        print("✅ RCA complete. Saved → cluster_rca_report.md")
-        return final
+        logger.info(f"✅ RCA complete. Saved → {REPORT_FILE}")
+        logger.info(f"♻️ RCA cache stats: {self.rca.cache.stats}")
+        return REPORT_FILE
@@ -1,11 +1,13 @@
 import asyncio
-from agent import AgenticInfraRCA
+from agent import get_agent
+from utils.logging_helper import setup_logging
 
 def main():
+    setup_logging()
     print("🚀 Starting entity-agnostic Agentic Infra RCA ...")
-    agent = AgenticInfraRCA()
-    # default: analyze Pod, Node, Deployment, Service
-    asyncio.run(agent.analyze_cluster(exclude_system=True))
+    with get_agent() as agent:
+        # default: analyze Pod, Node, Deployment, Service
+        asyncio.run(agent.analyze_cluster(exclude_system=True))
 
 if __name__ == "__main__":
     main()
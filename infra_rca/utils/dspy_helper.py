@@ -7,31 +7,162 @@ Unified helper for Agentic Infra RCA reasoning using Gemini models.
 • Safe parsing + fallback + verbose debug logging
 """
 
+import io
 import os
+import re
+import json
+import ahocorasick
 import google.generativeai as genai
 import time
+import threading
+from functools import cached_property
+from utils.rca_cache import LLMCache
+from utils.rate_limiter import TokenBucket
+
+
+# Static part of every RCA prompt, sent as the model's system instruction.
+SYSTEM_INSTRUCTION = """
+You are an expert Site Reliability Engineer performing Root Cause Analysis on Kubernetes infrastructure.
+
+### Instruction
+Analyze the provided resource data (context, describe, events, logs, metrics) and identify:
+1. Root cause — concise one-line diagnosis.
+2. RCA Category: <Infra | Config | Application | Network | Image | Resource>
+3. Reasoning — 2-5 sentence summary explaining the causal chain.
+4. Recommendations — bullet points of actionable fixes.
+5.  YAML patch — minimal manifest changes to remediate (if relevant).  
+If no manifest change is required (e.g., node or service issue), use "# none".
+
+
+Respond with a JSON object:
+{"root_cause": "<one-line>", "category": "<Infra | Config | Application | Network | Image | Resource>", "reasoning": "<2-5 sentence paragraph>", "recommendations": ["<item1>", "<item2>"], "patch_yaml": "<YAML fix or '# none'>"}
+"""
+
+# Gemini structured-output schemas (response_schema) for single and batched RCA
+_RCA_PROPERTIES = {
+    "root_cause": {"type": "STRING"},
+    "category": {"type": "STRING", "enum": ["Infra", "Config", "Application", "Network", "Image", "Resource"]},
+    "reasoning": {"type": "STRING"},
+    "recommendations": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "patch_yaml": {"type": "STRING"},
+}
+RCA_SCHEMA = {
+    "type": "OBJECT",
+    "properties": _RCA_PROPERTIES,
+    "required": ["root_cause", "category", "reasoning", "recommendations", "patch_yaml"],
+}
+RCA_BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "INTEGER"}, **_RCA_PROPERTIES},
+        "required": ["id", "root_cause", "category", "reasoning", "recommendations", "patch_yaml"],
+    },
+}
+
+# ------------------------------------------------------------------ #
+# Output-parsing patterns (compiled once)
+# ------------------------------------------------------------------ #
+_RE_ROOT_CAUSE_LINE = re.compile(r"Root\s*Cause\s*:\s*(.*?)(?:\n|$)", re.IGNORECASE)
+_RE_ROOT_CAUSE = re.compile(r"Root\s*Cause\s*:\s*(.*?)(?:Reasoning:|Recommendations:|Patch:|$)", re.IGNORECASE | re.DOTALL)
+_RE_REASONING = re.compile(r"Reasoning\s*:\s*(.*?)(?:Recommendations:|Patch:|$)", re.IGNORECASE | re.DOTALL)
+_RE_BULLET = re.compile(r"-\s+([^\n]+)")
+_RE_FENCE = re.compile(r"```(?:yaml)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_RE_YAML_KEYS = re.compile(r"\b(spec|containers|image|metadata|apiVersion)\b")
+_RE_FENCE_MARKER = re.compile(r"```+(?:yaml)?")
+_RE_SPEC_BLOCK = re.compile(r"(spec:.*?)(?=\n\S|$)", re.DOTALL)
+_RE_PARTIAL_JSON = re.compile(r'"(root_cause|category)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_RE_BATCH_HEADER = re.compile(r"^\W*Resource\s*\[(\d+)\]\W*$", re.MULTILINE)
+
+# Section headers of the free-text RCA format; bodies run to the next header
+_SECTION_RE = re.compile(
+    r"^[ \t]*(Root Cause|RCA Category|Category|Reasoning|Recommendations|Patch|Suggested Manifest Patch)[ \t]*:",
+    re.IGNORECASE | re.MULTILINE,
+)
+_RE_REC_ITEM = re.compile(r"^[ \t]*- (.+)$", re.MULTILINE)
+
+# Lower-cased header → parser section
+_SECTION_HEADERS = {
+    "root cause": "root_cause",
+    "rca category": "category",
+    "category": "category",
+    "reasoning": "reasoning",
+    "recommendations": "recommendations",
+    "patch": "patch",
+    "suggested manifest patch": "patch",
+}
+
+# Fallback category keywords, in priority order (first group wins)
+_CATEGORY_KEYWORDS = (
+    ("Image Issue", ("imagepull", "imagepullbackoff", "errimagepull", "image not found", "failed to pull")),
+    ("Health Probe Failure", ("probe", "readiness", "liveness")),
+    ("Resource Pressure", ("memory", "oom", "pressure", "oomkilled", "out of memory")),
+    ("Network Issue", ("dns", "connection", "timeout")),
+)
+_CATEGORY_AUTOMATON = ahocorasick.Automaton()
+for _prio, (_label, _keywords) in enumerate(_CATEGORY_KEYWORDS):
+    for _kw in _keywords:
+        _CATEGORY_AUTOMATON.add_word(_kw, (_prio, _label))
+_CATEGORY_AUTOMATON.make_automaton()
+
+# Keyword in the model's category → report category
+_CATEGORY_MAP = {
+    "network": "Network Issue",
+    "image": "Image Issue",
+    "resource": "Resource Pressure",
+    "application": "Application Failure",
+    "probe": "Health Probe Failure",
+}
 
 
 class InfraRCAHelper:
-    def __init__(self, primary_model="gemini-2.5-flash", fallback_model="gemini-1.5-pro-latest"):
+    # One limiter per process, shared by every helper instance and worker thread
+    _limiter = TokenBucket(
+        rpm=int(os.getenv("GEMINI_RPM", 60)),
+        tpm=int(os.getenv("GEMINI_TPM", 1_000_000)),
+    )
+
+    def __init__(self, primary_model="gemini-2.5-flash", fallback_model="gemini-1.5-pro-latest", warmup=True):
         key = os.getenv("GEMINI_API_KEY")
         if not key:
             raise EnvironmentError("❌ Missing GEMINI_API_KEY")
-        genai.configure(api_key=key)
+        # gRPC keeps one persistent HTTP/2 channel for all calls (GEMINI_TRANSPORT=rest to opt out)
+        genai.configure(api_key=key, transport=os.getenv("GEMINI_TRANSPORT", "grpc"))
 
         self.primary_model_name = primary_model
         self.fallback_model_name = fallback_model
-        self.primary = genai.GenerativeModel(primary_model)
-        self.fallback = genai.GenerativeModel(self.fallback_model_name)
+        self.cache = LLMCache()
+
+        if warmup:
+            threading.Thread(target=self._warmup, daemon=True, name="gemini-warmup").start()
+
+    def _warmup(self):
+        """
+        Pay the one-time costs (auth, channel setup) off the hot path
+        with a 1-token call per model.
+        """
+        for attr in ("primary", "fallback"):
+            try:
+                self._limiter.acquire(1)
+                getattr(self, attr).generate_content("ok", generation_config={"max_output_tokens": 1})
+            except Exception as e:
+                print(f"ℹ️ Gemini {attr} warm-up skipped: {e}")
+
+    # Model clients are built on first use and then reused for every call
+    @cached_property
+    def primary(self):
+        return genai.GenerativeModel(self.primary_model_name, system_instruction=SYSTEM_INSTRUCTION)
+
+    @cached_property
+    def fallback(self):
+        return genai.GenerativeModel(self.fallback_model_name, system_instruction=SYSTEM_INSTRUCTION)
 
     # ------------------------------------------------------------------ #
     # Prompt construction
     # ------------------------------------------------------------------ #
     def build_prompt(self, kind: str, name: str, namespace: str, describe: str, events: str, logs: str, metrics: str, signals: str) -> str:
-        """Compose structured RCA reasoning prompt."""
+        """Compose the per-resource part of the RCA prompt (instructions live in SYSTEM_INSTRUCTION)."""
         return f"""
-You are an expert Site Reliability Engineer performing Root Cause Analysis on Kubernetes infrastructure.
-
 ### Context
 Resource Kind: {kind}
 Name: {name}
@@ -49,56 +180,244 @@ Detected Signals: {signals}
 
 ### Metrics
 {metrics}
-
----
-
-### Instruction
-Analyze the above data and identify:
-1. Root cause — concise one-line diagnosis.
-2. RCA Category: <Infra | Config | Application | Network | Image | Resource>
-3. Reasoning — 2-5 sentence summary explaining the causal chain.
-4. Recommendations — bullet points of actionable fixes.
-5.  YAML patch — minimal manifest changes to remediate (if relevant).  
-If no manifest change is required (e.g., node or service issue), respond with:
-`Patch: # none`
-
-
-Respond **exactly** in this format:
-
-Root Cause: <one-line>
-RCA Category: <Infra | Config | Application | Network | Image | Resource>
-Reasoning: <multi-line short paragraph>
-Recommendations:
-- <item1>
-- <item2>
-Patch:
-```yaml
-<YAML fix or leave '# none'>
 """
 
     # ------------------------------------------------------------------ #
     # Main reasoning method
     # ------------------------------------------------------------------ #
-    def run_rca(self, kind, name, namespace, describe, events, logs, metrics, signals) -> dict:
+    def run_rca(self, kind, name, namespace, describe, events, logs, metrics, signals, on_partial=None) -> dict:
         """
         Run RCA reasoning with robust parsing, smart retry, and YAML cleanup.
         Supports multi-model fallback (Gemini flash → pro) and patch extraction.
+        `on_partial(field, value)` receives root_cause / category while streaming.
         """
-        import re
         from time import sleep
 
+        # 0️⃣ --- Response cache (exact → semantic) ---
+        cached, cache_key, cache_vec = self.cache.lookup(kind, name, signals, describe, events, logs)
+        if cached is not None:
+            print(f"♻️ RCA cache hit for {kind}/{name} — skipping Gemini.")
+            return cached
+
         # 1️⃣ --- Prompt generation ---
         prompt = self.build_prompt(kind, name, namespace, describe, events, logs, metrics, signals)
 
         # 2️⃣ --- Primary generation ---
-        text = self._generate(prompt, self.primary)
+        text = self._generate(prompt, self.primary, on_partial=on_partial, response_schema=RCA_SCHEMA)
         if not text or text.startswith("[Gemini error"):
             print("⚠️ Retrying with fallback model:", getattr(self.fallback, "model_name", "gemini-1.5-pro"))
-            text = self._generate(prompt, self.fallback)
+            text = self._generate(prompt, self.fallback, on_partial=on_partial, response_schema=RCA_SCHEMA)
 
         print("\n🧠 Raw Gemini RCA Output:\n", text, "\n")
 
-        # 3️⃣ --- Initialize parsed fields ---
+        # 3️⃣ --- Parse model output (structured JSON; free-text parser as fallback) ---
+        fields = self._parse_rca_json(text)
+        if fields is None:
+            print("⚠️ RCA output is not valid JSON — falling back to text parser.")
+            fields = self._parse_rca_text(text)
+
+        # 8️⃣ --- Smart Retry (only if too generic or no actions) ---
+        retry_needed = False
+        if ("not identified" in fields["root_cause"].lower()) or (
+            any("no actionable" in r.lower() for r in fields["recommendations"])
+        ):
+            retry_needed = True
+
+        if retry_needed:
+            print("🔁 RCA result too weak — retrying with refined prompt (deep mode)...")
+            refined_prompt = (
+                f"Focus only on finding a concrete root cause and actionable fix.\n"
+                f"If metrics or events imply a cause, infer it.\n"
+                f"Object: {kind}/{name} (ns={namespace})\n"
+                f"Describe:\n{describe}\n\nEvents:\n{events}\n\nLogs:\n{logs}\n\nMetrics:\n{metrics}\n\nSignals:\n{signals}\n"
+            )
+            sleep(2)
+            retry_text = self._generate(refined_prompt, self.fallback, response_schema=RCA_SCHEMA)
+            print("🧠 Retry Gemini Output:\n", retry_text, "\n")
+
+            retry = self._parse_rca_json(retry_text)
+            if retry is not None:
+                if retry["root_cause"]:
+                    fields["root_cause"] = retry["root_cause"]
+                fields["recommendations"] = [r for r in retry["recommendations"] if "no actionable" not in r.lower()]
+            else:
+                rc_match = _RE_ROOT_CAUSE_LINE.search(retry_text)
+                recs = _RE_BULLET.findall(retry_text)
+                if rc_match:
+                    fields["root_cause"] = rc_match.group(1).strip()
+                if recs:
+                    fields["recommendations"] = [r.strip() for r in recs if r.strip()]
+
+            if not fields["root_cause"]:
+                fields["root_cause"] = "Root cause could not be inferred even after retry."
+            if not fields["recommendations"]:
+                fields["recommendations"] = ["Manual investigation recommended."]
+
+        # 9️⃣ --- Final validation
+        self._finalize_fields(fields)
+
+        print("🧩 Parsed RCA fields:",
+            {k: (v[:100] + "..." if isinstance(v, str) and len(v) > 100 else v)
+            for k, v in fields.items()})
+
+        if self._cacheable(text, fields):
+            self.cache.store(cache_key, cache_vec, fields, name)
+        return fields
+
+
+    # ------------------------------------------------------------------ #
+    # Batched reasoning (several resources → one Gemini call)
+    # ------------------------------------------------------------------ #
+    def build_batch_prompt(self, items: list) -> str:
+        """Compose one RCA prompt covering several resources."""
+        blocks = []
+        for i, it in enumerate(items, 1):
+            blocks.append(f"""
+### Resource [{i}]
+Resource Kind: {it["kind"]}
+Name: {it["name"]}
+Namespace: {it.get("namespace") or ""}
+Detected Signals: {it.get("signals", "")}
+
+#### Cluster Describe
+{it.get("describe", "")}
+
+#### Events
+{it.get("events", "")}
+
+#### Logs
+{it.get("logs", "")}
+
+#### Metrics
+{it.get("metrics", "")}
+""")
+        return f"""
+Analyze each of the {len(items)} resources below independently.
+{"".join(blocks)}
+---
+
+### Instruction
+For EVERY resource above identify the root cause, RCA category, reasoning,
+recommendations and a minimal YAML patch (or "# none").
+
+Respond with ONLY a JSON array — one object per resource, same order, `id` = resource number:
+
+[{{"id": 1, "root_cause": "<one-line>", "category": "<Infra | Config | Application | Network | Image | Resource>", "reasoning": "<short paragraph>", "recommendations": ["<item1>", "<item2>"], "patch_yaml": "<YAML fix or '# none'>"}}]
+"""
+
+    def run_rca_batch(self, items: list) -> list:
+        """
+        Run RCA for several resources in a single Gemini request.
+        Each item carries the run_rca keyword arguments. Returns a list aligned
+        with `items`; entries the model did not answer are None so callers can
+        fall back to run_rca for them.
+        """
+        if not items:
+            return []
+
+        # Serve cached resources first; only the misses go to Gemini
+        results = [None] * len(items)
+        probes = {}
+        for i, it in enumerate(items):
+            cached, key, vec = self.cache.lookup(**it)
+            if cached is not None:
+                results[i] = cached
+            else:
+                probes[i] = (key, vec)
+        if len(probes) < len(items):
+            print(f"♻️ RCA cache served {len(items) - len(probes)}/{len(items)} batched resources.")
+        if not probes:
+            return results
+
+        pending = list(probes)
+        items = [items[i] for i in pending]
+        prompt = self.build_batch_prompt(items)
+        text = self._generate(prompt, self.primary, max_output_tokens=8192, response_schema=RCA_BATCH_SCHEMA)
+        if not text or text.startswith("[Gemini error"):
+            print("⚠️ Retrying batch with fallback model:", getattr(self.fallback, "model_name", "gemini-1.5-pro"))
+            text = self._generate(prompt, self.fallback, max_output_tokens=8192, response_schema=RCA_BATCH_SCHEMA)
+
+        print(f"\n🧠 Raw Gemini batch RCA Output ({len(items)} resources):\n", text, "\n")
+
+        parsed = self._parse_batch_json(text, len(items))
+        if parsed is None:
+            print("⚠️ Batch output is not a JSON array — falling back to section parser.")
+            parsed = self._parse_batch_sections(text, len(items))
+
+        for idx, fields in enumerate(parsed):
+            if fields and fields["root_cause"]:
+                results[pending[idx]] = self._finalize_fields(fields)
+                if self._cacheable(text, fields):
+                    self.cache.store(*probes[pending[idx]], fields, items[idx]["name"])
+        return results
+
+    def _parse_batch_json(self, text: str, count: int):
+        """Parse the JSON-array batch answer; None when the output is not valid JSON."""
+        start, end = text.find("["), text.rfind("]")
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, list):
+            return None
+
+        results = [None] * count
+        for pos, obj in enumerate(data):
+            if not isinstance(obj, dict):
+                continue
+            try:
+                idx = int(obj.get("id", pos + 1)) - 1
+            except (TypeError, ValueError):
+                idx = pos
+            if not 0 <= idx < count:
+                continue
+            results[idx] = self._fields_from_json(obj)
+        return results
+
+    def _parse_rca_json(self, text: str):
+        """Parse a structured single-resource answer; None when it is not a JSON object."""
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return self._fields_from_json(obj) if isinstance(obj, dict) else None
+
+    def _fields_from_json(self, obj: dict) -> dict:
+        """Map one JSON RCA object onto the parsed-fields dict used by the report."""
+        recs = obj.get("recommendations") or []
+        if isinstance(recs, str):
+            recs = [recs]
+        patch = _RE_FENCE_MARKER.sub("", str(obj.get("patch_yaml") or "")).strip()
+        fields = {
+            "root_cause": str(obj.get("root_cause") or "").strip(),
+            "reasoning": str(obj.get("reasoning") or "").strip(),
+            "recommendations": [str(x).strip() for x in recs if str(x).strip()]
+            or ["No actionable recommendations found."],
+            "patch_yaml": patch if patch.lower() not in ("", "none", "# none") else "# none",
+            "category": self._normalize_category(str(obj.get("category") or "").strip()),
+        }
+        if not fields["category"]:
+            fields["category"] = self._infer_category(fields)
+        return fields
+
+    def _parse_batch_sections(self, text: str, count: int) -> list:
+        """Fallback: split free-text output on `Resource [n]` headers and parse each block."""
+        results = [None] * count
+        headers = list(_RE_BATCH_HEADER.finditer(text))
+        for i, m in enumerate(headers):
+            idx = int(m.group(1)) - 1
+            if not 0 <= idx < count:
+                continue
+            section = text[m.end():headers[i + 1].start() if i + 1 < len(headers) else len(text)]
+            results[idx] = self._parse_rca_text(section)
+        return results
+
+    # ------------------------------------------------------------------ #
+    # Output parsing (shared by single and batched RCA)
+    # ------------------------------------------------------------------ #
+    def _parse_rca_text(self, text: str) -> dict:
+        """Parse one RCA block (Root Cause / Category / Reasoning / Recommendations / Patch)."""
+        # --- Initialize parsed fields ---
         fields = {
             "root_cause": "",
             "reasoning": "",
@@ -108,200 +427,163 @@ Patch:
         }
 
         patch_lines = []
-        capture_patch = False
-        capture_recs = False
-        reasoning_lines = []
 
-        # 4️⃣ --- Parse model output ---
-        for raw_line in text.splitlines():
-            line = raw_line.strip()
-            low = line.lower()
+        # --- Split into sections: one finditer pass over the header lines ---
+        matches = list(_SECTION_RE.finditer(text))
 
-            if not line:
-                continue
+        # Text outside any section (preamble, root-cause continuation);
+        # only used when there is no Reasoning section
+        loose = io.StringIO()
+        loose.write((text[:matches[0].start()] if matches else text).strip())
 
-            if low.startswith("root cause:"):
-                fields["root_cause"] = line.split(":", 1)[1].strip()
-                capture_patch = capture_recs = False
-
-            elif low.startswith("rca category:") or low.startswith("category:"):
-                cat = line.split(":", 1)[1].strip().capitalize()
-                if "network" in cat:
-                    fields["category"] = "Network Issue"
-                elif "image" in cat:
-                    fields["category"] = "Image Issue"
-                elif "resource" in cat:
-                    fields["category"] = "Resource Pressure"
-                elif "application" in cat:
-                    fields["category"] = "Application Failure"
-                elif "probe" in cat:
-                    fields["category"] = "Health Probe Failure"
-                else:
-                    fields["category"] = cat
-
-            elif low.startswith("reasoning:"):
-                fields["reasoning"] = line.split(":", 1)[1].strip()
-                reasoning_lines.append(fields["reasoning"])
-                capture_patch = capture_recs = False
-
-            elif low.startswith("recommendations:"):
-                capture_recs = True
-                capture_patch = False
-
-            elif low.startswith("patch:") or low.startswith("suggested manifest patch:"):
-                capture_patch = True
-                capture_recs = False
-
-            elif capture_recs and line.startswith("- "):
-                rec = line[2:].strip()
-                if rec and not rec.lower().startswith("name:"):
-                    fields["recommendations"].append(rec)
-
-            elif capture_patch:
-                patch_lines.append(line)
+        for i, m in enumerate(matches):
+            section = _SECTION_HEADERS[m.group(1).lower()]
+            body = text[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+            stripped = body.strip()
+            first_line = stripped.split("\n", 1)[0].strip()
 
-            else:
-                reasoning_lines.append(line)
+            if section == "root_cause":
+                fields["root_cause"] = first_line
+                rest = stripped[len(first_line):].strip()
+                if rest:
+                    loose.write("\n" + rest)
+
+            elif section == "category":
+                fields["category"] = self._normalize_category(first_line)
 
-        # 5️⃣ --- Fallback regex extraction for RootCause/Reasoning/Rec/Patch ---
+            elif section == "reasoning":
+                fields["reasoning"] = stripped
+
+            elif section == "recommendations":
+                for rec in _RE_REC_ITEM.findall(body):
+                    rec = rec.strip()
+                    if rec and not rec.lower().startswith("name:"):
+                        fields["recommendations"].append(rec)
+
+            elif section == "patch":
+                patch_lines.append(body.strip("\n"))
+
+        # --- Fallback regex extraction for RootCause/Reasoning/Rec/Patch ---
         if not fields["root_cause"]:
-            rc_match = re.search(r"Root\s*Cause\s*:\s*(.*?)(?:Reasoning:|Recommendations:|Patch:|$)",
-                                text, re.IGNORECASE | re.DOTALL)
+            rc_match = _RE_ROOT_CAUSE.search(text)
             if rc_match:
                 fields["root_cause"] = rc_match.group(1).strip()
 
         if not fields["reasoning"]:
-            r_match = re.search(r"Reasoning\s*:\s*(.*?)(?:Recommendations:|Patch:|$)",
-                                text, re.IGNORECASE | re.DOTALL)
+            r_match = _RE_REASONING.search(text)
             if r_match:
                 fields["reasoning"] = r_match.group(1).strip()
             else:
-                fields["reasoning"] = "\n".join(reasoning_lines).strip()
+                fields["reasoning"] = loose.getvalue().strip()
 
         if not fields["recommendations"]:
-            recs = re.findall(r"-\s+([^\n]+)", text)
+            recs = _RE_BULLET.findall(text)
             fields["recommendations"] = [r.strip() for r in recs if r.strip()] or ["No actionable recommendations found."]
 
         # Extract YAML from fenced blocks
-        fence_pattern = re.compile(r"```(?:yaml)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
-        fenced = fence_pattern.findall(text)
-        for block in fenced:
-            if re.search(r"\b(spec|containers|image|metadata|apiVersion)\b", block):
+        for block in _RE_FENCE.findall(text):
+            if _RE_YAML_KEYS.search(block):
                 patch_lines.append(block.strip())
 
         # Combine all patch sections
         patch_yaml = "\n\n".join([p for p in patch_lines if p.strip()])
 
-        # 6️⃣ --- Patch cleanup (dedup + strip fences) ---
-        patch_yaml = patch_yaml.strip()
-        patch_yaml = re.sub(r"```+yaml", "", patch_yaml)
-        patch_yaml = re.sub(r"```+", "", patch_yaml)
-
-        # Deduplicate repeated lines
-        seen = set()
-        clean_lines = []
-        for line in patch_yaml.splitlines():
-            if line.strip() not in seen:
-                seen.add(line.strip())
-                clean_lines.append(line)
-        patch_yaml = "\n".join(clean_lines).strip()
-
-        # Keep longest YAML block if multiple
-        yaml_blocks = re.findall(r"(spec:.*?)(?=\n\S|$)", patch_yaml, flags=re.DOTALL)
-        if len(yaml_blocks) > 1:
-            patch_yaml = max(yaml_blocks, key=len).strip()
-
-        if not patch_yaml or patch_yaml.lower() in ["# none", "none", ""]:
-            patch_yaml = "# none"
-        fields["patch_yaml"] = patch_yaml
-
-        # 7️⃣ --- Category heuristics if empty ---
-        combined_text = (fields["root_cause"] + " " + fields["reasoning"]).lower()
-        if not fields["category"]:
-            if any(k in combined_text for k in ("imagepull", "imagepullbackoff", "errimagepull", "image not found", "failed to pull")):
-                fields["category"] = "Image Issue"
-            elif any(k in combined_text for k in ("probe", "readiness", "liveness")):
-                fields["category"] = "Health Probe Failure"
-            elif any(k in combined_text for k in ("memory", "oom", "pressure", "oomkilled", "out of memory")):
-                fields["category"] = "Resource Pressure"
-            elif any(k in combined_text for k in ("dns", "connection", "timeout")):
-                fields["category"] = "Network Issue"
-            else:
-                fields["category"] = "General Anomaly"
+        # --- Patch cleanup (strip fences, then dedup) ---
+        patch_yaml = _RE_FENCE_MARKER.sub("", patch_yaml).strip()
 
-        # 8️⃣ --- Smart Retry (only if too generic or no actions) ---
-        retry_needed = False
-        if ("not identified" in fields["root_cause"].lower()) or (
-            any("no actionable" in r.lower() for r in fields["recommendations"])
-        ):
-            retry_needed = True
+        # Common case (node/service issues): nothing to clean up
+        if patch_yaml.lower() in ("", "# none", "none"):
+            fields["patch_yaml"] = "# none"
+        else:
+            # Deduplicate repeated lines (first occurrence wins, order kept)
+            unique = {}
+            for line in patch_yaml.splitlines():
+                unique.setdefault(line.strip(), line)
+            patch_yaml = "\n".join(unique.values()).strip()
 
-        if retry_needed:
-            print("🔁 RCA result too weak — retrying with refined prompt (deep mode)...")
-            refined_prompt = (
-                f"Focus only on finding a concrete root cause and actionable fix.\n"
-                f"If metrics or events imply a cause, infer it.\n"
-                f"Object: {kind}/{name} (ns={namespace})\n"
-                f"Describe:\n{describe}\n\nEvents:\n{events}\n\nLogs:\n{logs}\n\nMetrics:\n{metrics}\n\nSignals:\n{signals}\n"
-            )
-            sleep(2)
-            retry_text = self._generate(refined_prompt, self.fallback)
-            print("🧠 Retry Gemini Output:\n", retry_text, "\n")
+            # Keep longest YAML block if multiple
+            yaml_blocks = _RE_SPEC_BLOCK.findall(patch_yaml)
+            if len(yaml_blocks) > 1:
+                patch_yaml = max(yaml_blocks, key=len).strip()
 
-            rc_match = re.search(r"Root\s*Cause\s*:\s*(.*?)(?:\n|$)", retry_text, re.IGNORECASE)
-            recs = re.findall(r"-\s+(.*)", retry_text)
-            if rc_match:
-                fields["root_cause"] = rc_match.group(1).strip()
-            if recs:
-                fields["recommendations"] = [r.strip() for r in recs if r.strip()]
+            fields["patch_yaml"] = patch_yaml or "# none"
 
-            if not fields["root_cause"]:
-                fields["root_cause"] = "Root cause could not be inferred even after retry."
-            if not fields["recommendations"]:
-                fields["recommendations"] = ["Manual investigation recommended."]
+        # --- Category heuristics if empty ---
+        if not fields["category"]:
+            fields["category"] = self._infer_category(fields)
 
-        # 9️⃣ --- Final validation
+        return fields
+
+    @staticmethod
+    def _normalize_category(raw: str) -> str:
+        """Map the model's RCA category onto the report's category names."""
+        cat_low = raw.lower()
+        return next((v for k, v in _CATEGORY_MAP.items() if k in cat_low), raw.capitalize())
+
+    @staticmethod
+    def _infer_category(fields: dict) -> str:
+        """Keyword heuristics when the model gave no category."""
+        combined_text = (fields["root_cause"] + " " + fields["reasoning"]).lower()
+        best = min((hit for _, hit in _CATEGORY_AUTOMATON.iter(combined_text)), default=None)
+        return best[1] if best else "General Anomaly"
+
+    @staticmethod
+    def _cacheable(text: str, fields: dict) -> bool:
+        """Only cache real diagnoses — never errors or 'not identified' fallbacks."""
+        rc = fields["root_cause"].lower()
+        return not text.startswith("[Gemini error") and not any(
+            s in rc for s in ("not identified", "could not be inferred")
+        )
+
+    @staticmethod
+    def _finalize_fields(fields: dict) -> dict:
         if not fields["root_cause"]:
             fields["root_cause"] = "Root cause not identified."
         if not fields["reasoning"]:
             fields["reasoning"] = "No reasoning extracted from RCA output."
-
-        print("🧩 Parsed RCA fields:",
-            {k: (v[:100] + "..." if isinstance(v, str) and len(v) > 100 else v)
-            for k, v in fields.items()})
-
         return fields
 
-
     # ------------------------------------------------------------------ #
     # Updated _generate with variable temperature
     # ------------------------------------------------------------------ #
-    def _generate(self, prompt: str, model, temperature=0.5) -> str:
-        """Safe Gemini generation with adjustable creativity."""
+    def _generate(self, prompt: str, model, temperature=0.5, max_output_tokens=4096, on_partial=None,
+                  response_schema=None) -> str:
+        """
+        Safe streaming Gemini generation with adjustable creativity.
+        `on_partial(field, value)` is called for root_cause / category as soon
+        as they have streamed in, while the rest is still decoding.
+        `response_schema` switches Gemini to structured JSON output.
+        """
+        request = dict(
+            contents=[{"role": "user", "parts": [{"text": prompt}]}],
+            generation_config={
+                "temperature": temperature,
+                "max_output_tokens": max_output_tokens,
+                "top_p": 0.9,
+                **({"response_mime_type": "application/json", "response_schema": response_schema}
+                   if response_schema else {}),
+            },
+            safety_settings={
+                "HARASSMENT": "BLOCK_NONE",
+                "HATE": "BLOCK_NONE",
+                "SEXUAL": "BLOCK_NONE",
+                "DANGEROUS": "BLOCK_NONE",
+            },
+        )
+        # Rough input estimate (~4 chars/token) plus the output budget
+        self._limiter.acquire(len(prompt) // 4 + max_output_tokens)
         try:
-            resp = model.generate_content(
-                contents=[{"role": "user", "parts": [{"text": prompt}]}],
-                generation_config={
-                    "temperature": temperature,
-                    "max_output_tokens": 4096,
-                    "top_p": 0.9,
-                },
-                safety_settings={
-                    "HARASSMENT": "BLOCK_NONE",
-                    "HATE": "BLOCK_NONE",
-                    "SEXUAL": "BLOCK_NONE",
-                    "DANGEROUS": "BLOCK_NONE",
-                },
-            )
+            resp = model.generate_content(**request, stream=True)
 
-            if hasattr(resp, "resolve"):
-                try:
-                    resp.resolve()
-                except Exception:
-                    pass
+            feed = self._partial_feeder(on_partial) if on_partial else None
+            buffer = ""
+            for chunk in resp:
+                buffer += self._chunk_text(chunk)
+                if feed:
+                    feed(buffer)
 
-            if hasattr(resp, "text") and resp.text:
-                return resp.text.strip()
+            if buffer.strip():
+                return buffer.strip()
 
             if hasattr(resp, "candidates") and resp.candidates:
                 candidate = resp.candidates[0]
@@ -314,3 +596,55 @@ Patch:
 
         except Exception as e:
             return f"[Gemini error: {e}]"
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Text of one streamed chunk; reads candidate parts when `.text` is unavailable."""
+        try:
+            return chunk.text
+        except ValueError:
+            candidates = getattr(chunk, "candidates", None) or []
+            if not candidates or not candidates[0].content:
+                return ""
+            return "".join(p.text for p in candidates[0].content.parts if hasattr(p, "text"))
+
+    @staticmethod
+    def _partial_feeder(on_partial):
+        """
+        Build feed(buffer) for a streaming response: reports root_cause / category
+        once each, from completed JSON string values or "Root Cause:" text lines.
+        """
+        prefixes = (("root_cause", "root cause:"), ("category", "rca category:"))
+        emitted = set()
+        pos = 0   # end of the last scanned text line
+        jpos = 0  # end of the last matched JSON field
+
+        def emit(field, value):
+            if field in emitted:
+                return
+            emitted.add(field)
+            try:
+                on_partial(field, value)
+            except Exception as e:
+                print(f"⚠️ on_partial callback failed: {e}")
+
+        def feed(buffer):
+            nonlocal pos, jpos
+            for m in _RE_PARTIAL_JSON.finditer(buffer, jpos):
+                try:
+                    emit(m.group(1), json.loads(f'"{m.group(2)}"'))
+                except json.JSONDecodeError:
+                    pass
+                jpos = m.end()
+
+            end = buffer.rfind("\n") + 1
+            if end <= pos:
+                return
+            for line in buffer[pos:end].splitlines():
+                low = line.strip().lower()
+                for field, prefix in prefixes:
+                    if low.startswith(prefix):
+                        emit(field, line.split(":", 1)[1].strip())
+            pos = end
+
+        return feed
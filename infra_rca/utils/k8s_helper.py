@@ -1,16 +1,95 @@
+import re
 import subprocess
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 from kubernetes import client, config
 import urllib3
 from kubernetes.client import Configuration, ApiClient
+from utils.metrics_client import format_pod_metrics, format_node_metrics
+
+# kind -> (api attribute, namespaced reader, cluster-scoped reader)
+_READERS = {
+    "pod": ("v1", "read_namespaced_pod", None),
+    "node": ("v1", None, "read_node"),
+    "service": ("v1", "read_namespaced_service", None),
+    "configmap": ("v1", "read_namespaced_config_map", None),
+    "persistentvolumeclaim": ("v1", "read_namespaced_persistent_volume_claim", None),
+    "pvc": ("v1", "read_namespaced_persistent_volume_claim", None),
+    "persistentvolume": ("v1", None, "read_persistent_volume"),
+    "deployment": ("apps", "read_namespaced_deployment", None),
+    "replicaset": ("apps", "read_namespaced_replica_set", None),
+    "statefulset": ("apps", "read_namespaced_stateful_set", None),
+    "daemonset": ("apps", "read_namespaced_daemon_set", None),
+}
+
+# kind -> (api attribute, namespaced lister, all-namespaces lister)
+_LISTERS = {
+    "pod": ("v1", "list_namespaced_pod", "list_pod_for_all_namespaces"),
+    "service": ("v1", "list_namespaced_service", "list_service_for_all_namespaces"),
+    "configmap": ("v1", "list_namespaced_config_map", "list_config_map_for_all_namespaces"),
+    "persistentvolumeclaim": ("v1", "list_namespaced_persistent_volume_claim", "list_persistent_volume_claim_for_all_namespaces"),
+    "pvc": ("v1", "list_namespaced_persistent_volume_claim", "list_persistent_volume_claim_for_all_namespaces"),
+    "deployment": ("apps", "list_namespaced_deployment", "list_deployment_for_all_namespaces"),
+    "replicaset": ("apps", "list_namespaced_replica_set", "list_replica_set_for_all_namespaces"),
+    "statefulset": ("apps", "list_namespaced_stateful_set", "list_stateful_set_for_all_namespaces"),
+    "daemonset": ("apps", "list_namespaced_daemon_set", "list_daemon_set_for_all_namespaces"),
+}
+
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+
+# Log fetch bounds: a short tail is enough signal and keeps the prompt dense
+LOG_TAIL_LINES = 50
+LOG_SINCE_SECONDS = 300
+LOG_LIMIT_BYTES = 65536
+
+
+def _crashed_container(pod):
+    """
+    Name of the currently down (waiting / terminated) container that restarted
+    or was terminated most. None when every container is running again: a
+    recovered container's previous instance is stale history.
+    """
+    worst, worst_restarts = None, 0
+    for cs in (pod.status.container_statuses or []) if pod.status else []:
+        if not (cs.state and (cs.state.waiting or cs.state.terminated)):
+            continue
+        restarts = cs.restart_count or 0
+        terminated = bool(cs.last_state and cs.last_state.terminated)
+        if (restarts or terminated) and (worst is None or restarts > worst_restarts):
+            worst, worst_restarts = cs.name, restarts
+    return worst
+
+
+def _event_time(e):
+    return getattr(e, "last_timestamp", None) or getattr(e, "event_time", None) or getattr(e.metadata, "creation_timestamp", None)
+
+
+def _kind_key(kind: str, table: dict):
+    """Lower-case kind, accepting plurals like `replicasets`."""
+    k = kind.lower()
+    if k not in table and k.endswith("s") and k[:-1] in table:
+        k = k[:-1]
+    return k
+
 
 class K8sHelper:
     """Kubernetes helper: connect via API (in-cluster or kubeconfig) with fallback (kubectl)."""
 
-    def __init__(self, skip_tls_on_fail=True):
+    def __init__(self, skip_tls_on_fail=True, fetch_workers=16):
         self.v1 = None
         self.core = None
+        self.apps = None
+        self.custom = None
         self.skip_tls_on_fail = skip_tls_on_fail
+        # Shared by every collect_resource_data call (4 fetches per resource); size it
+        # from the caller's collect concurrency or it becomes the real fan-out limit
+        self._fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="k8s-fetch")
         self._connect_to_k8s()
+        if self.v1:
+            # Share the CoreV1 connection pool with the other API groups
+            self.apps = client.AppsV1Api(self.v1.api_client)
+            self.custom = client.CustomObjectsApi(self.v1.api_client)
 
     def _connect_to_k8s(self):
         # Try in-cluster first
@@ -91,7 +170,21 @@ class K8sHelper:
             out = subprocess.getoutput("kubectl get nodes --no-headers | awk '{print $1}'")
             return [l.strip() for l in out.splitlines() if l.strip()]
 
-        # For namespaced kinds:
+        # For namespaced kinds: API first, kubectl only for kinds we don't map
+        key = _kind_key(kind, _LISTERS)
+        if self.v1 and key in _LISTERS:
+            api_attr, namespaced, all_ns = _LISTERS[key]
+            api = getattr(self, api_attr)
+            try:
+                if namespace:
+                    items = getattr(api, namespaced)(namespace).items
+                    return [o.metadata.name for o in items]
+                items = getattr(api, all_ns)().items
+                return [(o.metadata.name, o.metadata.namespace) for o in items]
+            except Exception as e:
+                print(f"⚠️ Error listing {kind} via API: {e}")
+                return []
+
         ns_flag = f"-n {namespace}" if namespace else "-A"
         try:
             out = subprocess.getoutput(f"kubectl get {kind_lower} {ns_flag} --no-headers -o custom-columns=KIND:.kind,NAME:.metadata.name,NAMESPACE:.metadata.namespace")
@@ -105,72 +198,134 @@ class K8sHelper:
         except Exception:
             return []
 
+    # -------------------------
+    # API-backed describe / metrics
+    # -------------------------
+    def describe_resource(self, kind: str, name: str, namespace: str = None) -> str:
+        """
+        Read the object through the API and render it as YAML (managedFields
+        dropped). Kinds without a mapped reader fall back to `kubectl describe`.
+        """
+        key = _kind_key(kind, _READERS)
+        if key not in _READERS:
+            ns_flag = f"-n {namespace}" if namespace else ""
+            return subprocess.getoutput(f"kubectl describe {kind} {name} {ns_flag} 2>/dev/null || true")
+
+        api_attr, namespaced, cluster = _READERS[key]
+        api = getattr(self, api_attr)
+        obj = getattr(api, namespaced)(name, namespace or "default") if namespaced else getattr(api, cluster)(name)
+        data = self.v1.api_client.sanitize_for_serialization(obj)
+        data.get("metadata", {}).pop("managedFields", None)
+        return yaml.safe_dump(data, sort_keys=False)
+
+    def resource_metrics(self, kind: str, name: str, namespace: str = None) -> str:
+        """Usage from metrics.k8s.io for pods / nodes (what `kubectl top` shows)."""
+        try:
+            if kind.lower() == "pod":
+                obj = self.custom.get_namespaced_custom_object("metrics.k8s.io", "v1beta1", namespace, "pods", name)
+                return format_pod_metrics(obj)
+            if kind.lower() == "node":
+                obj = self.custom.get_cluster_custom_object("metrics.k8s.io", "v1beta1", "nodes", name)
+                return format_node_metrics(obj)
+        except Exception:
+            pass
+        return "metrics unavailable"
+
     # -------------------------
     # Generic resource data collection (entity-agnostic)
     # -------------------------
     def collect_resource_data(self, kind: str, name: str, namespace: str = None):
         """
-        Collect describe, events, logs (if pod), metrics (kubectl top fallback).
+        Collect describe, events, logs (if pod), metrics (metrics.k8s.io; kubectl top without API access).
+        The four fetches are independent I/O and run concurrently.
         Returns dict with keys: describe, events, logs, metrics
         """
-        describe = ""
-        events = ""
-        logs = ""
-        metrics = ""
+        futures = {
+            key: self._fetch_pool.submit(fetch, kind, name, namespace)
+            for key, fetch in (
+                ("describe", self._fetch_describe),
+                ("events", self._fetch_events),
+                ("logs", self._fetch_logs),
+                ("metrics", self._fetch_metrics),
+            )
+        }
+        return {key: f.result() or "" for key, f in futures.items()}
 
-        # Prefer API when possible for structured data
-        if self.v1:
-            try:
-                if kind.lower() == "pod":
-                    pod_obj = self.v1.read_namespaced_pod(name, namespace)
-                    describe = pod_obj.to_str()
-                elif kind.lower() == "node":
-                    node_obj = self.v1.read_node(name)
-                    describe = node_obj.to_str()
-                else:
-                    # for deployments/services, use kubectl describe for readability
-                    describe = subprocess.getoutput(f"kubectl describe {kind} {name} -n {namespace}") if namespace else subprocess.getoutput(f"kubectl describe {kind} {name}")
-            except Exception:
-                # fallback to kubectl describe text
-                ns_flag = f"-n {namespace}" if namespace else ""
-                describe = subprocess.getoutput(f"kubectl describe {kind} {name} {ns_flag}")
+    # Each fetcher returns "" instead of raising so one slow/failed call can't sink the RCA
+    def _fetch_describe(self, kind, name, namespace):
+        ns_flag = f"-n {namespace}" if namespace else ""
+        try:
+            if self.v1:
+                try:
+                    return self.describe_resource(kind, name, namespace)
+                except Exception:
+                    # fallback to kubectl describe text
+                    pass
+            return subprocess.getoutput(f"kubectl describe {kind} {name} {ns_flag} 2>/dev/null || true")
+        except Exception:
+            return ""
 
-            # Events via API filtering
-            try:
-                evs = self.v1.list_namespaced_event(namespace) if namespace else self.v1.list_event_for_all_namespaces()
-                pod_events = []
-                for e in evs.items:
-                    obj = e.involved_object
-                    if obj and obj.name == name and (not namespace or obj.namespace == namespace):
-                        ts = getattr(e, "last_timestamp", None) or getattr(e, "event_time", None) or ""
-                        pod_events.append(f"{ts} {e.type} {e.reason}: {e.message}")
-                events = "\n".join(pod_events)
-            except Exception:
-                ns_flag = f"-n {namespace}" if namespace else ""
-                events = subprocess.getoutput(f"kubectl get events {ns_flag} --field-selector involvedObject.name={name} -o wide")
-            # logs only for pods
-            if kind.lower() == "pod":
+    def _fetch_events(self, kind, name, namespace):
+        ns_flag = f"-n {namespace}" if namespace else ""
+        try:
+            if self.v1:
+                # Events filtered server-side; keep the newest 20
                 try:
-                    logs = self.v1.read_namespaced_pod_log(name, namespace, tail_lines=200)
+                    selector = f"involvedObject.name={name}"
+                    if namespace:
+                        evs = self.v1.list_namespaced_event(namespace, field_selector=selector, limit=50)
+                    else:
+                        evs = self.v1.list_event_for_all_namespaces(field_selector=f"{selector},involvedObject.kind={kind}", limit=50)
+                    stamped = sorted(((_event_time(e), e) for e in evs.items),
+                                     key=lambda p: (p[0] is not None, p[0] or 0))[-20:]
+                    return "\n".join(f"{ts or ''} {e.type} {e.reason}: {e.message}" for ts, e in stamped)
                 except Exception:
-                    logs = subprocess.getoutput(f"kubectl logs {name} -n {namespace} --tail=200 2>/dev/null || true")
-        else:
-            # cli-only fallback
-            ns_flag = f"-n {namespace}" if namespace else ""
-            describe = subprocess.getoutput(f"kubectl describe {kind} {name} {ns_flag} 2>/dev/null || true")
-            events = subprocess.getoutput(f"kubectl get events {ns_flag} --field-selector involvedObject.name={name} -o wide 2>/dev/null || true")
-            if kind.lower() == "pod":
-                logs = subprocess.getoutput(f"kubectl logs {name} -n {namespace} --tail=200 2>/dev/null || true")
+                    pass
+            return subprocess.getoutput(f"kubectl get events {ns_flag} --field-selector involvedObject.name={name} -o wide 2>/dev/null || true")
+        except Exception:
+            return ""
 
+    def _fetch_logs(self, kind, name, namespace):
+        # logs only for pods
+        if kind.lower() != "pod":
+            return ""
+        try:
+            if self.v1:
+                try:
+                    return _ANSI_RE.sub("", self._read_pod_logs(name, namespace))
+                except Exception:
+                    pass
+            out = subprocess.getoutput(f"kubectl logs {name} -n {namespace} --tail={LOG_TAIL_LINES} --limit-bytes={LOG_LIMIT_BYTES} 2>/dev/null || true")
+            return _ANSI_RE.sub("", out)
+        except Exception:
+            return ""
+
+    def _read_pod_logs(self, name, namespace):
+        """
+        Container down after a crash (CrashLoopBackOff / terminated) → its
+        previous instance's last lines (the pre-crash output); otherwise the
+        last few minutes of the current one.
+        """
+        bounds = {"tail_lines": LOG_TAIL_LINES, "limit_bytes": LOG_LIMIT_BYTES}
+        container = _crashed_container(self.v1.read_namespaced_pod_status(name, namespace))
+        if container:
+            try:
+                return self.v1.read_namespaced_pod_log(
+                    name, namespace, container=container, previous=True, timestamps=True, **bounds
+                )
+            except Exception:
+                pass  # no previous instance retained — fall back to current logs
+        return self.v1.read_namespaced_pod_log(name, namespace, since_seconds=LOG_SINCE_SECONDS, **bounds)
+
+    def _fetch_metrics(self, kind, name, namespace):
+        if self.v1:
+            return self.resource_metrics(kind, name, namespace)
         # metrics (kubectl top) — apply namespace for pods
         try:
             if kind.lower() == "pod":
-                metrics = subprocess.getoutput(f"kubectl top pod {name} -n {namespace} --no-headers 2>/dev/null || echo 'metrics unavailable'")
-            elif kind.lower() == "node":
-                metrics = subprocess.getoutput(f"kubectl top node {name} --no-headers 2>/dev/null || echo 'metrics unavailable'")
-            else:
-                metrics = "metrics unavailable"
+                return subprocess.getoutput(f"kubectl top pod {name} -n {namespace} --no-headers 2>/dev/null || echo 'metrics unavailable'")
+            if kind.lower() == "node":
+                return subprocess.getoutput(f"kubectl top node {name} --no-headers 2>/dev/null || echo 'metrics unavailable'")
         except Exception:
-            metrics = "metrics unavailable"
-
-        return {"describe": describe or "", "events": events or "", "logs": logs or "", "metrics": metrics or ""}
+            pass
+        return "metrics unavailable"
@@ -1,12 +1,51 @@
 import os
 import subprocess
 import requests
+from requests.adapters import HTTPAdapter
+
+_MEM_UNITS = {"Ki": 1 / 1024, "Mi": 1, "Gi": 1024, "Ti": 1024 * 1024}
+
+
+def _cpu_millicores(q: str) -> float:
+    if q.endswith("n"):
+        return int(q[:-1]) / 1e6
+    if q.endswith("u"):
+        return int(q[:-1]) / 1e3
+    if q.endswith("m"):
+        return float(q[:-1])
+    return float(q) * 1000
+
+
+def _mem_mib(q: str) -> float:
+    for suffix, factor in _MEM_UNITS.items():
+        if q.endswith(suffix):
+            return float(q[:-len(suffix)]) * factor
+    return float(q) / (1024 * 1024)
+
+
+def format_pod_metrics(obj: dict) -> str:
+    """metrics.k8s.io PodMetrics → `kubectl top pod` style line (containers summed)."""
+    cpu = sum(_cpu_millicores(c["usage"]["cpu"]) for c in obj.get("containers", []))
+    mem = sum(_mem_mib(c["usage"]["memory"]) for c in obj.get("containers", []))
+    return f"{obj['metadata']['name']} {cpu:.0f}m {mem:.0f}Mi"
+
+
+def format_node_metrics(obj: dict) -> str:
+    """metrics.k8s.io NodeMetrics → `name: CPU <m>, Memory <Mi>` line."""
+    usage = obj["usage"]
+    return f"{obj['metadata']['name']}: CPU {_cpu_millicores(usage['cpu']):.0f}m, Memory {_mem_mib(usage['memory']):.0f}Mi"
+
 
 class MetricsClient:
-    """Lightweight metrics client: prefer kubectl top; optional Prometheus if PROM_URL set."""
+    """Lightweight metrics client: metrics.k8s.io via the API client, kubectl top without one; optional Prometheus if PROM_URL set."""
 
-    def __init__(self):
+    def __init__(self, custom_api=None):
         self.prom_url = os.getenv("PROM_URL")
+        self.custom = custom_api
+        # Keep-alive pool so repeated Prometheus queries skip TCP/TLS setup
+        self.session = requests.Session()
+        if self.prom_url:
+            self.session.mount(self.prom_url, HTTPAdapter(pool_connections=4, pool_maxsize=16))
 
     def summarize_nodes(self):
         """Return a short textual summary of node CPU/memory."""
@@ -14,7 +53,7 @@ class MetricsClient:
             # example simple query: node CPU usage in cores (instant)
             try:
                 q = 'sum by (instance) (rate(node_cpu_seconds_total[5m]))'
-                resp = requests.get(f"{self.prom_url}/api/v1/query", params={"query": q}, timeout=5)
+                resp = self.session.get(f"{self.prom_url}/api/v1/query", params={"query": q}, timeout=(1, 5))
                 j = resp.json()
                 lines = []
                 for r in j.get("data", {}).get("result", []):
@@ -25,6 +64,14 @@ class MetricsClient:
             except Exception:
                 pass
 
+        if self.custom:
+            try:
+                data = self.custom.list_cluster_custom_object("metrics.k8s.io", "v1beta1", "nodes")
+                lines = [format_node_metrics(item) for item in data.get("items", [])]
+                return "\n".join(lines) if lines else "No node metrics available"
+            except Exception:
+                pass
+
         # fallback to kubectl top
         out = subprocess.getoutput("kubectl top nodes --no-headers 2>/dev/null || echo 'metrics unavailable'")
         lines = []
@@ -36,5 +83,11 @@ class MetricsClient:
         return "\n".join(lines) if lines else "No node metrics available"
 
     def summarize_pod(self, namespace, pod):
+        if self.custom:
+            try:
+                obj = self.custom.get_namespaced_custom_object("metrics.k8s.io", "v1beta1", namespace, "pods", pod)
+                return format_pod_metrics(obj)
+            except Exception:
+                return "metrics unavailable"
         out = subprocess.getoutput(f"kubectl top pod {pod} -n {namespace} --no-headers 2>/dev/null || echo 'metrics unavailable'")
         return out.strip()
@@ -0,0 +1,45 @@
+"""
+TokenBucket
+-----------
+Proactive requests/min + tokens/min limiter for Gemini calls.
+Both buckets refill continuously at RPM/60 and TPM/60 per second; callers
+block in acquire() until a request slot and the estimated tokens are
+available, so bursts are smoothed instead of bouncing off 429s.
+"""
+
+import time
+import threading
+
+
+class TokenBucket:
+    def __init__(self, rpm: int, tpm: int):
+        self.max_requests = float(rpm)
+        self.max_tokens = float(tpm)
+        self.available_requests = self.max_requests
+        self.available_tokens = self.max_tokens
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+        self.available_requests = min(self.max_requests, self.available_requests + elapsed * self.max_requests / 60)
+        self.available_tokens = min(self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60)
+
+    def acquire(self, est_tokens: int = 0):
+        """Block until one request and `est_tokens` tokens can be spent (thread-safe)."""
+        # A single oversized request must not wait forever
+        est_tokens = min(est_tokens, self.max_tokens)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= est_tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= est_tokens
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.max_requests,
+                    (est_tokens - self.available_tokens) * 60 / self.max_tokens,
+                )
+            time.sleep(max(wait, 0.01))
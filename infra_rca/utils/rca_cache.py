@@ -0,0 +1,143 @@
+"""
+LLMCache
+--------
+Response cache for InfraRCAHelper.
+• Exact layer: sha256 over kind + signals + normalized describe/events/logs
+• Semantic layer: cosine similarity over Gemini text embeddings (≥ threshold)
+  of kind + signals + events/logs; the describe YAML would drown them out
+Normalization strips timestamps, pod-hash suffixes, IPs and numbers so the same
+failure on different pods / runs collides. Entries are stored with the resource
+name masked and handed back renamed to the resource being looked up.
+"""
+
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import google.generativeai as genai
+
+_TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?")
+_POD_HASH_RE = re.compile(r"-[a-z0-9]{8,10}-[a-z0-9]{5}\b")
+_IP_RE = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b")
+_HEX_RE = re.compile(r"\b[0-9a-f]{12,}\b")
+_NUM_RE = re.compile(r"\d+")
+_WS_RE = re.compile(r"[ \t]+")
+_NAME_MASK = "<resource>"
+
+# text-embedding-004 accepts ~2k tokens; the head of the payload carries the signal
+_EMBED_MAX_CHARS = 8000
+
+
+def normalize(text: str) -> str:
+    """Mask run-specific tokens so near-identical payloads compare equal."""
+    text = _TIMESTAMP_RE.sub("<ts>", text or "")
+    text = _POD_HASH_RE.sub("-<hash>", text)
+    text = _IP_RE.sub("<ip>", text)
+    text = _HEX_RE.sub("<id>", text)
+    text = _NUM_RE.sub("0", text)
+    return _WS_RE.sub(" ", text).strip()
+
+
+class LLMCache:
+    def __init__(self, threshold: float = 0.92, max_entries: int = 512,
+                 embed_model: str = "models/text-embedding-004"):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embed_model = embed_model
+        self._exact = OrderedDict()      # key -> fields
+        self._keys = []                  # row -> exact key
+        self._vectors = None             # (n, d) unit vectors
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses}
+
+    # ------------------------------------------------------------------ #
+    # Keys / embeddings
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _rename(v, old: str, new: str):
+        """Swap a resource name inside cached RCA field values (str / list of str)."""
+        if not old:
+            return v
+        if isinstance(v, str):
+            return v.replace(old, new)
+        if isinstance(v, list):
+            return [LLMCache._rename(x, old, new) for x in v]
+        return v
+
+    @staticmethod
+    def _payload(kind, name, signals, *texts) -> str:
+        masked = (LLMCache._rename(t or "", name, _NAME_MASK) for t in texts)
+        return "\n".join((kind, signals, *(normalize(t) for t in masked)))
+
+    def _embed(self, text: str):
+        try:
+            res = genai.embed_content(model=self.embed_model, content=text[:_EMBED_MAX_CHARS])
+        except Exception as e:
+            print(f"⚠️ Embedding failed, semantic cache skipped: {e}")
+            return None
+        vec = np.asarray(res["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    # ------------------------------------------------------------------ #
+    # Lookup / store
+    # ------------------------------------------------------------------ #
+    def lookup(self, kind, name, signals, describe, events, logs, **_):
+        """
+        Return (fields, key, vector). `fields` is a copy of the cached RCA,
+        renamed to `name`, on a hit, otherwise None; pass `key` and `vector`
+        back to store() on a miss.
+        """
+        payload = self._payload(kind, name, signals, describe, events, logs)
+        key = hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+        with self._lock:
+            if key in self._exact:
+                self.hits += 1
+                return self._restore(self._exact[key], name), key, None
+
+        vec = self._embed(self._payload(kind, name, signals, events, logs))
+        if vec is not None:
+            with self._lock:
+                if self._vectors is not None and len(self._keys):
+                    scores = self._vectors @ vec
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        self.semantic_hits += 1
+                        return self._restore(self._exact[self._keys[best]], name), key, vec
+
+        with self._lock:
+            self.misses += 1
+        return None, key, vec
+
+    def store(self, key, vector, fields: dict, name: str = ""):
+        with self._lock:
+            if key in self._exact:
+                return
+            self._exact[key] = {k: self._rename(v, name, _NAME_MASK) for k, v in fields.items()}
+            if vector is not None:
+                self._keys.append(key)
+                row = vector[None, :]
+                self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+
+            # Evict oldest entries (FIFO) past the bound
+            while len(self._exact) > self.max_entries:
+                old, _ = self._exact.popitem(last=False)
+                if old in self._keys:
+                    i = self._keys.index(old)
+                    del self._keys[i]
+                    self._vectors = np.delete(self._vectors, i, axis=0)
+
+    @staticmethod
+    def _restore(fields: dict, name: str) -> dict:
+        """Copy of a cached entry with the masked name replaced by `name`."""
+        return {k: LLMCache._rename(v, _NAME_MASK, name or _NAME_MASK) for k, v in fields.items()}
@@ -1,36 +1,64 @@
 import os
+import sys
 import time
-import json
+import orjson
+import atexit
+import signal
+import asyncio
 import traceback
+import ahocorasick
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from kubernetes import client, config, watch
-from agent import AgenticInfraRCA
-from threading import Lock
+from kubernetes.client.rest import ApiException
+from agent import get_agent
+from utils.logging_helper import setup_logging
 
 # ===============================================================
-# 🔧 Global Locks & Persistent Cooldown Cache
+# 🔧 Persistent Cooldown Cache
 # ===============================================================
-rca_lock = Lock()
 CACHE_FILE = "rca_seen_cache.json"
 RCA_COOLDOWN = 300  # 5 minutes
+CACHE_FLUSH_INTERVAL = 30  # seconds between background flushes
+RCA_CONCURRENCY = int(os.getenv("RCA_CONCURRENCY", 8))
+RCA_BATCH_WINDOW = 2.0  # seconds to gather a burst into one Gemini request
+RCA_BATCH_SIZE = 8      # keeps the batched answer within the output budget
 
 def load_cache():
     try:
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
+        with open(CACHE_FILE, "rb") as f:
+            return orjson.loads(f.read())
     except Exception:
         return {}
 
 def save_cache():
+    """Prune long-expired keys and atomically write the cooldown cache to disk."""
+    now = time.time()
+    with cache_lock:
+        for key in [k for k, ts in last_rca_time.items() if now - ts > RCA_COOLDOWN * 2]:
+            del last_rca_time[key]
+        snapshot = dict(last_rca_time)
+    tmp = CACHE_FILE + ".tmp"
     try:
-        with open(CACHE_FILE, "w") as f:
-            json.dump(last_rca_time, f)
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(snapshot))
+        os.replace(tmp, CACHE_FILE)
     except Exception as e:
         print(f"⚠️ Failed to save RCA cache: {e}")
 
-# load cache on start
+def _flush_loop():
+    while True:
+        time.sleep(CACHE_FLUSH_INTERVAL)
+        save_cache()
+
+# load cache on start; it lives in memory and is flushed in the background,
+# on normal exit and on SIGTERM
+cache_lock = threading.Lock()
 last_rca_time = load_cache()
+threading.Thread(target=_flush_loop, daemon=True, name="rca-cache-flush").start()
+atexit.register(save_cache)
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
 
 # ===============================================================
 # ✅ Kubernetes Connection
@@ -44,7 +72,8 @@ except Exception:
 # ✅ Prepare Directories and Agent
 # ===============================================================
 os.makedirs("rca_reports", exist_ok=True)
-agent = AgenticInfraRCA()
+setup_logging()
+agent = get_agent()
 
 RCA_TRIGGERS = [
     "CrashLoopBackOff",
@@ -57,6 +86,12 @@ RCA_TRIGGERS = [
     "Unhealthy",
 ]
 
+# One automaton pass over each event reason instead of a scan per trigger
+TRIGGER_AUTOMATON = ahocorasick.Automaton()
+for _trigger in RCA_TRIGGERS:
+    TRIGGER_AUTOMATON.add_word(_trigger, _trigger)
+TRIGGER_AUTOMATON.make_automaton()
+
 # ===============================================================
 # 🧠 Reusable Helper Functions
 # ===============================================================
@@ -64,36 +99,57 @@ def should_skip_rca(kind, name, ns):
     """Check cooldown cache to prevent duplicate RCAs."""
     key = f"{kind}:{name}:{ns}"
     now = time.time()
-    if key in last_rca_time and now - last_rca_time[key] < RCA_COOLDOWN:
-        print(f"⏳ Skipping duplicate RCA for {key} (cooldown active).")
-        return True
-    last_rca_time[key] = now
-    save_cache()
+    with cache_lock:
+        if key in last_rca_time and now - last_rca_time[key] < RCA_COOLDOWN:
+            print(f"⏳ Skipping duplicate RCA for {key} (cooldown active).")
+            return True
+        last_rca_time[key] = now
     return False
 
 
 def trigger_rca(kind, name, ns, category="General Anomaly", prefix="event"):
-    """Centralized RCA execution, locking, and saving."""
+    """Centralized RCA execution and saving (runs on a worker thread)."""
     try:
-        if should_skip_rca(kind, name, ns):
-            return
+        def on_partial(field, value):
+            print(f"⚡ [{kind}/{name}] early {field.replace('_', ' ')}: {value}")
 
-        with rca_lock:
-            result = agent.analyze_resource(kind=kind, name=name, namespace=ns)
+        result = agent.analyze_resource(kind=kind, name=name, namespace=ns, on_partial=on_partial)
+        report_rca(kind, name, ns, result, category, prefix)
 
-        if not result:
-            print(f"⚠️ No data found for {kind}/{name}, skipping RCA.")
-            return
+    except Exception as e:
+        print(f"❌ RCA execution failed for {kind}/{name}: {e}")
+        traceback.print_exc()
 
-        print(f"🧩 RCA Fields: RootCause='{result.get('root_cause','')[:60]}', "
-              f"Reasoning='{result.get('reasoning','')[:60]}', "
-              f"Category='{result.get('category','')}.'")
 
-        save_rca_report(kind, name, ns, result, category=result.get("category", category), prefix=prefix)
+def trigger_rca_batch(jobs):
+    """Run RCA for several queued (kind, name, ns, category, prefix) jobs in one Gemini request."""
+    if len(jobs) == 1:
+        return trigger_rca(*jobs[0])
 
+    print(f"📦 Batching RCA for {len(jobs)} resources")
+    try:
+        results = agent.analyze_resources([(kind, name, ns) for kind, name, ns, _, _ in jobs])
     except Exception as e:
-        print(f"❌ RCA execution failed for {kind}/{name}: {e}")
-        traceback.print_exc()
+        print(f"❌ Batched RCA failed ({e}) — falling back to per-resource RCA.")
+        for job in jobs:
+            trigger_rca(*job)
+        return
+
+    for (kind, name, ns, category, prefix), result in zip(jobs, results):
+        report_rca(kind, name, ns, result, category, prefix)
+
+
+def report_rca(kind, name, ns, result, category="General Anomaly", prefix="event"):
+    """Log the headline fields and persist the report for one RCA result."""
+    if not result:
+        print(f"⚠️ No data found for {kind}/{name}, skipping RCA.")
+        return
+
+    print(f"🧩 RCA Fields: RootCause='{result.get('root_cause','')[:60]}', "
+          f"Reasoning='{result.get('reasoning','')[:60]}', "
+          f"Category='{result.get('category','')}.'")
+
+    save_rca_report(kind, name, ns, result, category=result.get("category", category), prefix=prefix)
 
 
 def save_rca_report(kind, name, ns, result, category="General Anomaly", prefix="event"):
@@ -131,27 +187,106 @@ def save_rca_report(kind, name, ns, result, category="General Anomaly", prefix="
         traceback.print_exc()
 
 
+# ===============================================================
+# 📬 RCA Queue & Workers
+# ===============================================================
+# Watcher threads only enqueue; RCA_CONCURRENCY workers on the event loop
+# drain the queue so a burst of events is analyzed in parallel, packing up
+# to RCA_BATCH_SIZE jobs that arrive within RCA_BATCH_WINDOW into one request.
+# The workers run on their own pool so metrics polling (default executor) is
+# never stuck behind a long RCA, and vice versa.
+_loop = None
+_queue = None
+_rca_pool = None
+
+
+def submit_rca(kind, name, ns, category="General Anomaly", prefix="event"):
+    """Thread-safe hand-off from a watcher thread to the RCA queue."""
+    _loop.call_soon_threadsafe(_queue.put_nowait, (kind, name, ns, category, prefix))
+
+
+async def next_batch():
+    """Wait for one job, then drain whatever else arrives within the batch window."""
+    jobs = [await _queue.get()]
+    deadline = _loop.time() + RCA_BATCH_WINDOW
+    while len(jobs) < RCA_BATCH_SIZE:
+        remaining = deadline - _loop.time()
+        if remaining <= 0:
+            break
+        try:
+            jobs.append(await asyncio.wait_for(_queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    return jobs
+
+
+async def rca_worker():
+    while True:
+        jobs = await next_batch()
+        try:
+            # Cooldown check runs on the loop thread, so it is never interleaved
+            todo = [job for job in jobs if not should_skip_rca(*job[:3])]
+            if todo:
+                # one pool thread per worker, so at most RCA_CONCURRENCY batches run at once
+                await _loop.run_in_executor(_rca_pool, trigger_rca_batch, todo)
+        finally:
+            for _ in jobs:
+                _queue.task_done()
+
+
 # ===============================================================
 # 👀 Event Watcher
 # ===============================================================
+def _latest_event_rv(v1):
+    """resourceVersion of the Warning event list right now — watching from here skips history."""
+    return v1.list_event_for_all_namespaces(field_selector="type=Warning", limit=1).metadata.resource_version
+
+
 def watch_cluster_events():
     v1 = client.CoreV1Api()
     w = watch.Watch()
     print("👀 Starting event watcher (Agentic RCA Mode)...")
 
+    rv = ""
     while True:
         try:
-            for evt in w.stream(v1.list_event_for_all_namespaces, timeout_seconds=60):
+            if not rv:
+                rv = _latest_event_rv(v1)
+            # Only Warning events can carry an RCA trigger reason (the API has no OR on reason)
+            for evt in w.stream(
+                v1.list_event_for_all_namespaces,
+                field_selector="type=Warning",
+                resource_version=rv,
+                allow_watch_bookmarks=True,
+                timeout_seconds=600,
+            ):
                 event_obj = evt["object"]
-                reason = getattr(event_obj, "reason", "")
-                if any(t in reason for t in RCA_TRIGGERS):
+                if evt["type"] == "ERROR":
+                    if isinstance(event_obj, dict) and event_obj.get("code") == 410:
+                        raise ApiException(status=410, reason="Gone")
+                    continue
+
+                # Resume point for reconnects (bookmarks carry only this)
+                rv = event_obj.metadata.resource_version or rv
+                if evt["type"] not in ("ADDED", "MODIFIED"):
+                    continue  # BOOKMARK / DELETED
+
+                reason = getattr(event_obj, "reason", "") or ""
+                if next(TRIGGER_AUTOMATON.iter(reason), None):
                     involved = event_obj.involved_object
                     kind = involved.kind
                     ns = involved.namespace or "default"
                     name = involved.name
                     print(f"\n⚡ Detected issue [{reason}] on {kind}/{name} in ns={ns}")
-                    trigger_rca(kind, name, ns, category="Event Anomaly", prefix="event")
+                    submit_rca(kind, name, ns, category="Event Anomaly", prefix="event")
 
+        except ApiException as e:
+            if e.status == 410:
+                print("♻️ Event watch resourceVersion expired — resyncing from the latest version.")
+                rv = ""
+                continue
+            print(f"⚠️ Watch error: {e}. Restarting watcher in 5s...")
+            time.sleep(5)
         except Exception as e:
             print(f"⚠️ Watch error: {e}. Restarting watcher in 5s...")
             time.sleep(5)
@@ -161,13 +296,16 @@ def watch_cluster_events():
 # ===============================================================
 # 📊 Metrics Watcher
 # ===============================================================
-def watch_metrics(cpu_threshold=80, mem_threshold=80, interval=30):
+async def watch_metrics(cpu_threshold=80, mem_threshold=80, interval=30):
+    """Poll node metrics on the event loop; only the HTTP call leaves the loop thread."""
     metrics_api = client.CustomObjectsApi()
     print("📈 Starting metrics watcher...")
 
     while True:
         try:
-            data = metrics_api.list_cluster_custom_object("metrics.k8s.io", "v1beta1", "nodes")
+            data = await asyncio.to_thread(
+                metrics_api.list_cluster_custom_object, "metrics.k8s.io", "v1beta1", "nodes"
+            )
 
             for item in data["items"]:
                 kind = "Node"
@@ -182,54 +320,110 @@ def watch_metrics(cpu_threshold=80, mem_threshold=80, interval=30):
 
                 if cpu_m > cpu_threshold * 10 or mem_mi > mem_threshold * 10:
                     print(f"⚠️ Node {name} CPU={cpu_m}m, Memory={mem_mi}Mi > threshold")
-                    trigger_rca(kind, name, ns, category="Metrics Anomaly", prefix="metrics")
+                    _queue.put_nowait((kind, name, ns, "Metrics Anomaly", "metrics"))
 
-            time.sleep(interval)
+            await asyncio.sleep(interval)
 
         except Exception as e:
             print(f"⚠️ Metric watcher error: {e}")
-            time.sleep(10)
+            await asyncio.sleep(10)
 
 
 # ===============================================================
 # 🐳 Pod Status Watcher
 # ===============================================================
 
-def watch_pod_statuses(interval=20):
-    """Continuously scan for pods terminated due to OOMKilled or similar conditions."""
+# Completed pods can never need an RCA; everything else is filtered in Python.
+# (CrashLoopBackOff / OOMKilled-and-restarting pods stay in phase Running, so
+# Running cannot be excluded server-side.)
+POD_FIELD_SELECTOR = "status.phase!=Succeeded"
+
+
+def _pod_failure(pod):
+    """(reason, category, message) of the first failure found on a pod, or None if it looks healthy."""
+    ns = pod.metadata.namespace
+    name = pod.metadata.name
+    kind = "Pod"
+    conditions = pod.status.conditions or []
+    statuses = pod.status.container_statuses or []
+
+    # --- 1️⃣ Detect OOMKilled ---
+    for cs in statuses:
+        if cs.state and cs.state.terminated:
+            reason = cs.state.terminated.reason
+            exit_code = cs.state.terminated.exit_code
+            if reason == "OOMKilled" or exit_code == 137:
+                return "OOMKilled", "Resource Pressure", \
+                    f"⚡ OOMKilled detected for {kind}/{name} in ns={ns} (exitCode={exit_code})"
+
+    # --- 2️⃣ Detect PodFailed / NotReady containers ---
+    for cond in conditions:
+        if cond.type in ["Ready", "ContainersReady"] and cond.status == "False":
+            reason = getattr(cond, "reason", "")
+            if reason in ["PodFailed", "CrashLoopBackOff"]:
+                return reason, "Application Failure", \
+                    f"⚡ Pod failure condition [{reason}] for {kind}/{name} in ns={ns}"
+    return None
+
+
+def _check_pod(pod, last_reason):
+    """Submit RCA only when a pod's failure reason changes (healthy -> failing, or a new reason)."""
+    uid = pod.metadata.uid
+    failure = _pod_failure(pod)
+    reason = failure[0] if failure else None
+    if last_reason.get(uid) == reason:
+        return
+    last_reason[uid] = reason
+    if failure:
+        print(failure[2])
+        submit_rca("Pod", pod.metadata.name, pod.metadata.namespace, category=failure[1], prefix="event")
+
+
+def watch_pod_statuses():
+    """Watch pod deltas for OOMKilled or similar conditions (list once, then watch from that version)."""
     v1 = client.CoreV1Api()
+    w = watch.Watch()
     print("🔍 Starting pod status watcher (for OOMKilled, CrashLoopBackOff, PodFailed)...")
 
+    last_reason = {}  # uid -> failure reason last acted on (None = healthy)
+    rv = ""
     while True:
         try:
-            pods = v1.list_pod_for_all_namespaces(watch=False).items
-
-            for pod in pods:
-                ns = pod.metadata.namespace
-                name = pod.metadata.name
-                kind = "Pod"
-                conditions = pod.status.conditions or []
-                statuses = pod.status.container_statuses or []
-
-                # --- 1️⃣ Detect OOMKilled ---
-                for cs in statuses:
-                    if cs.state and cs.state.terminated:
-                        reason = cs.state.terminated.reason
-                        exit_code = cs.state.terminated.exit_code
-                        if reason == "OOMKilled" or exit_code == 137:
-                            print(f"⚡ OOMKilled detected for {kind}/{name} in ns={ns} (exitCode={exit_code})")
-                            trigger_rca(kind, name, ns, category="Resource Pressure", prefix="event")
-
-                # --- 2️⃣ Detect PodFailed / NotReady containers ---
-                for cond in conditions:
-                    if cond.type in ["Ready", "ContainersReady"] and cond.status == "False":
-                        reason = getattr(cond, "reason", "")
-                        if reason in ["PodFailed", "CrashLoopBackOff"]:
-                            print(f"⚡ Pod failure condition [{reason}] for {kind}/{name} in ns={ns}")
-                            trigger_rca(kind, name, ns, category="Application Failure", prefix="event")
-
-            time.sleep(interval)
-
+            if not rv:
+                # Initial / post-410 sync: one filtered list, then deltas only
+                pods = v1.list_pod_for_all_namespaces(field_selector=POD_FIELD_SELECTOR)
+                for pod in pods.items:
+                    _check_pod(pod, last_reason)
+                rv = pods.metadata.resource_version
+
+            for evt in w.stream(
+                v1.list_pod_for_all_namespaces,
+                field_selector=POD_FIELD_SELECTOR,
+                resource_version=rv,
+                allow_watch_bookmarks=True,
+                timeout_seconds=600,
+            ):
+                pod = evt["object"]
+                if evt["type"] == "ERROR":
+                    if isinstance(pod, dict) and pod.get("code") == 410:
+                        raise ApiException(status=410, reason="Gone")
+                    continue
+
+                rv = pod.metadata.resource_version or rv
+                if evt["type"] == "DELETED":
+                    # Deleted, or left the selector (e.g. Succeeded)
+                    last_reason.pop(pod.metadata.uid, None)
+                    continue
+                if evt["type"] in ("ADDED", "MODIFIED"):
+                    _check_pod(pod, last_reason)
+
+        except ApiException as e:
+            if e.status == 410:
+                print("♻️ Pod watch resourceVersion expired — relisting.")
+                rv = ""
+                continue
+            print(f"⚠️ Pod status watcher error: {e}")
+            time.sleep(10)
         except Exception as e:
             print(f"⚠️ Pod status watcher error: {e}")
             time.sleep(10)
@@ -238,15 +432,38 @@ def watch_pod_statuses(interval=20):
 # ===============================================================
 # 🚀 Entry Point
 # ===============================================================
-if __name__ == "__main__":
-    t1 = threading.Thread(target=watch_cluster_events)
-    t2 = threading.Thread(target=watch_metrics)
-    t3 = threading.Thread(target=watch_pod_statuses)
+def _in_daemon_thread(fn):
+    """Run a blocking watch stream on a daemon thread, as a future the loop can await.
+
+    The kubernetes watch iterators block, so they keep a thread each (daemon, so
+    shutdown never waits on an open stream) instead of tying up the RCA executor.
+    """
+    fut = _loop.create_future()
+
+    def run():
+        try:
+            fn()
+        except BaseException as e:
+            _loop.call_soon_threadsafe(fut.set_exception, e)
 
-    t1.start()
-    t2.start()
-    t3.start()
+    threading.Thread(target=run, daemon=True, name=fn.__name__).start()
+    return fut
 
-    t1.join()
-    t2.join()
-    t3.join()
+
+async def main():
+    global _loop, _queue, _rca_pool
+    _loop = asyncio.get_running_loop()
+    _rca_pool = ThreadPoolExecutor(max_workers=RCA_CONCURRENCY, thread_name_prefix="rca")
+    _queue = asyncio.Queue()
+
+    print(f"🚦 RCA workers: {RCA_CONCURRENCY}")
+    await asyncio.gather(
+        _in_daemon_thread(watch_cluster_events),
+        _in_daemon_thread(watch_pod_statuses),
+        watch_metrics(),
+        *(rca_worker() for _ in range(RCA_CONCURRENCY)),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -10,11 +10,14 @@ Uses:
 """
 
 import os
+import asyncio
+import threading
 from datetime import datetime
 
-from utils.github_helper import GitHubHelper
-from utils.similarity import find_relevant_kb
-from utils.duplicate_detector import find_similar_issues
+from utils.github_helper import GitHubHelper, issue_digest
+from utils.similarity import find_relevant_kb, kb_triage_fields
+from utils.duplicate_detector import embed_text, embed_texts, issue_text
+from utils.incident_index import get_incident_index
 from utils.dspy_helper import DSPyHelper
 
 
@@ -25,6 +28,9 @@ from utils.dspy_helper import DSPyHelper
 REPO = os.getenv("GITHUB_REPOSITORY") or "nikhiljiddigi/agentic-support-demo"
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 KB_REPO = os.getenv("GITHUB_REPOSITORY") or "nikhiljiddigi/agentic-kb"
+MAX_CONCURRENT_TRIAGE = int(os.getenv("AGENT_MAX_CONCURRENCY", "10"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+KB_TEMPLATE_THRESHOLD = float(os.getenv("KB_TEMPLATE_THRESHOLD", "0.90"))
 
 if not GITHUB_TOKEN:
     raise EnvironmentError("❌ Missing GITHUB_TOKEN (PAT with repo & issues permissions)")
@@ -43,10 +49,17 @@ class L1L2SupportAgent:
     def __init__(self):
         self.github = GitHubHelper(REPO, GITHUB_TOKEN)
         self.reasoner = DSPyHelper()  # uses Gemini backend
+        self._seed_lock = threading.Lock()  # concurrent triages seed the empty index once
         print(f"🔧 Initialized Agent for repo: {REPO}")
 
     # ---------------------------------------------------------------------- #
-    def triage_issue(self, issue: dict):
+    def triage_issue(self, issue: dict, all_issues: list = None):
+        asyncio.run(self.atriage_issue(issue, all_issues))
+
+    async def atriage_issue(self, issue: dict, all_issues: list = None):
+        """KB lookup and duplicate detection run concurrently, then reasoning.
+        `all_issues` is the caller's open-incident listing, if it already has one.
+        """
         issue_number = issue["number"]
         title = issue["title"]
         body = issue.get("body", "")
@@ -54,8 +67,11 @@ class L1L2SupportAgent:
 
         print(f"\n🚨 Processing incident #{issue_number}: {title}")
 
-        # 1️⃣ Find KB article match
-        kb_match = find_relevant_kb(body or title, KB_REPO, GITHUB_TOKEN)
+        # 1️⃣ KB article match  ||  2️⃣ Duplicate detection
+        kb_match, (duplicates, issue_vec) = await asyncio.gather(
+            asyncio.to_thread(find_relevant_kb, body or title, KB_REPO, GITHUB_TOKEN),
+            asyncio.to_thread(self._find_duplicates, issue, all_issues),
+        )
         kb_text = kb_match.get("content", "No KB found")
 
         if kb_match and kb_match['score'] >= 0.75:
@@ -63,9 +79,6 @@ class L1L2SupportAgent:
         else:
             kb_line = ""
 
-        # 2️⃣ Duplicate detection
-        all_issues = self.github.fetch_incident_issues()
-        duplicates = find_similar_issues(issue, all_issues, threshold=0.85)
         duplicate_section = ""
         if duplicates:
             dup_lines = [
@@ -75,8 +88,22 @@ class L1L2SupportAgent:
             ]
             duplicate_section = "\n\n🔁 **Similar Incidents:**\n" + "\n".join(dup_lines)
 
-        # 3️⃣ L1/L2 triage reasoning
-        fields = self.reasoner.run_reasoning(title, body, kb_text, now)
+        # 3️⃣ L1/L2 triage reasoning — a KB template or a near-identical issue's triage
+        #    stands in for the Gemini call when the match is strong enough
+        template = kb_triage_fields(kb_match.get("content")) if kb_match["score"] >= KB_TEMPLATE_THRESHOLD else {}
+        cached = None if template else self.github.find_cached_triage(
+            issue_vec, SEMANTIC_CACHE_THRESHOLD, exclude=issue_number
+        )
+        if template:
+            print(f"🔁 Served from KB template: {kb_match['file']}")
+            fields = template
+            kb_line = f"{kb_line}\n🔁 Triage served from the KB template".strip()
+        elif cached:
+            src, fields, score = cached
+            print(f"♻️ Reusing triage from #{src} (similarity {score:.3f})")
+            kb_line = f"{kb_line}\n♻️ Triage cached from #{src} (similarity {score:.3f})".strip()
+        else:
+            fields = await self.reasoner.arun_reasoning(title, body, kb_text, now)
 
         # 4️⃣ Compose triage summary
         comment = f"""
@@ -90,9 +117,44 @@ class L1L2SupportAgent:
 """.strip()
 
         # 5️⃣ Post once to GitHub
-        self.github.comment_issue_once(issue_number, comment)
+        await asyncio.to_thread(
+            self.github.comment_issue_once, issue_number, comment, fields, issue_vec, issue_digest(issue)
+        )
         print(f"✅ Triage posted for issue #{issue_number}")
 
+        # 6️⃣ Remember this incident for future duplicate lookups
+        await asyncio.to_thread(self._index_issue, issue, issue_vec)
+
+    def _find_duplicates(self, issue: dict, all_issues: list = None):
+        """Nearest historical incidents from the persistent index; returns (duplicates, issue vector)."""
+        index = get_incident_index()
+        if not len(index):
+            with self._seed_lock:
+                # Cold start: seed the index with the currently open incidents (re-checked
+                # under the lock so only the first of several concurrent triages does it)
+                if not len(index):
+                    self._seed_index(index, issue, all_issues)
+
+        vec = embed_text(issue_text(issue))
+        hits = index.query(vec, k=10, threshold=0.85, exclude=issue["number"])
+        duplicates = [{"number": n, "title": index.title(n), "score": round(score, 3)} for n, score in hits]
+        return duplicates, vec
+
+    def _seed_index(self, index, issue: dict, all_issues: list = None):
+        if all_issues is None:
+            all_issues = self.github.fetch_incident_issues()
+        seed = [i for i in all_issues if i["number"] != issue["number"]]
+        if seed:
+            index.add_many(
+                [i["number"] for i in seed], embed_texts([issue_text(i) for i in seed]), [i["title"] for i in seed]
+            )
+            index.save()
+
+    def _index_issue(self, issue: dict, vec):
+        index = get_incident_index()
+        index.add(issue["number"], vec, issue["title"])
+        index.save()
+
     # ---------------------------------------------------------------------- #
     def run(self):
         """Manually run triage on all open incident issues."""
@@ -102,11 +164,26 @@ class L1L2SupportAgent:
             return
 
         print(f"📋 Found {len(issues)} incident(s). Starting triage...\n")
+        pending = []
         for issue in issues:
-            if issue["number"] in self.github.cache.get("triaged", []):
+            if self.github.is_triaged(issue["number"], issue_digest(issue)):
                 print(f"⚠️ Issue #{issue['number']} already triaged.")
                 continue
-            self.triage_issue(issue)
+            pending.append(issue)
+        asyncio.run(self.atriage_many(pending, issues))
+
+    async def atriage_many(self, issues: list, all_issues: list = None):
+        """Triage issues concurrently, at most MAX_CONCURRENT_TRIAGE at a time."""
+        sem = asyncio.Semaphore(MAX_CONCURRENT_TRIAGE)
+
+        async def one(issue):
+            async with sem:
+                try:
+                    await self.atriage_issue(issue, all_issues)
+                except Exception as e:
+                    print(f"⚠️ Failed to triage issue #{issue['number']}: {e}")
+
+        await asyncio.gather(*(one(i) for i in issues))
 
 
 # --------------------------------------------------------------------------- #
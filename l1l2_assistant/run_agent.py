@@ -1,13 +1,24 @@
 import os
-import time
+import json
+import hmac
+import hashlib
+import asyncio
+import threading
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from l1l2_assistant import L1L2SupportAgent
+from l1l2_assistant import L1L2SupportAgent, MAX_CONCURRENT_TRIAGE
 
-# Poll interval in seconds
+# Poll interval in seconds (fallback when webhooks are missed or disabled)
 POLL_INTERVAL = int(os.getenv("AGENT_POLL_INTERVAL", "60"))  # default 1 minute
 PROCESSED_FILE = ".processed_issues.txt"
 
+# GitHub webhook receiver: set AGENT_WEBHOOK_PORT to enable, secret is optional but recommended
+WEBHOOK_PORT = int(os.getenv("AGENT_WEBHOOK_PORT", "0"))
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "").encode()
+WEBHOOK_ACTIONS = {"opened", "reopened", "labeled"}
+INCIDENT_LABEL = "incident"
+
 
 def load_processed():
     """Load IDs of already processed issues."""
@@ -24,36 +35,136 @@ def save_processed(processed):
             f.write(str(issue_id) + "\n")
 
 
-def main():
-    print("🤖 Starting Agentic L1/L2 Support Assistant (Continuous Mode)...")
-    agent = L1L2SupportAgent()
-    processed = load_processed()
+# --------------------------------------------------------------------------- #
+# Webhook receiver
+# --------------------------------------------------------------------------- #
 
-    while True:
-        try:
-            print(f"\n⏱️ Checking for new incident issues at {datetime.utcnow().isoformat()}...")
-            issues = agent.github.fetch_incident_issues()
-            new_issues = [i for i in issues if i["number"] not in processed]
+def _valid_signature(body: bytes, signature: str) -> bool:
+    if not WEBHOOK_SECRET:
+        return True
+    expected = "sha256=" + hmac.new(WEBHOOK_SECRET, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
 
-            if not new_issues:
-                print("✅ No new incidents.")
-            else:
-                print(f"🚨 Found {len(new_issues)} new incident(s): {[i['number'] for i in new_issues]}")
-                for issue in new_issues:
-                    try:
-                        agent.triage_issue(issue)
-                        processed.add(issue["number"])
-                    except Exception as e:
-                        print(f"⚠️ Failed to triage issue #{issue['number']}: {e}")
 
+def _incident_from_event(event: str, payload: dict):
+    """Return the issue dict for an `issues` event that should be triaged, else None."""
+    if event != "issues" or payload.get("action") not in WEBHOOK_ACTIONS:
+        return None
+    issue = payload.get("issue") or {}
+    labels = {l.get("name") for l in issue.get("labels", [])}
+    if issue.get("state") != "open" or INCIDENT_LABEL not in labels:
+        return None
+    return issue
+
+
+def start_webhook_server(port: int, enqueue):
+    """Serve GitHub `issues` webhooks on a daemon thread; `enqueue(issue)` must be thread-safe."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not _valid_signature(body, self.headers.get("X-Hub-Signature-256")):
+                self.send_response(401)
+                self.end_headers()
+                return
+            try:
+                issue = _incident_from_event(self.headers.get("X-GitHub-Event", ""), json.loads(body))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            if issue:
+                enqueue(issue)
+            # Ack fast: GitHub times out deliveries after 10s, triage runs on the worker
+            self.send_response(202)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🪝 Listening for GitHub webhooks on :{port}")
+    return server
+
+
+# --------------------------------------------------------------------------- #
+# Event loop: queue + triage workers + conditional-poll fallback
+# --------------------------------------------------------------------------- #
+
+async def triage_worker(agent, queue, processed, pending, failed):
+    while True:
+        issue, all_issues = await queue.get()
+        number = issue["number"]
+        try:
+            if number not in processed:
+                await agent.atriage_issue(issue, all_issues)
+                processed.add(number)
                 save_processed(processed)
+            failed.pop(number, None)
+        except Exception as e:
+            print(f"⚠️ Failed to triage issue #{number}: {e}")
+            # keep it for the next poll: an unchanged listing answers 304 and would never resend it
+            failed[number] = issue
+        finally:
+            pending.discard(number)
+            queue.task_done()
+
 
+async def poll_loop(agent, submit, processed, failed):
+    while True:
+        try:
+            print(f"\n⏱️ Checking for new incident issues at {datetime.utcnow().isoformat()}...")
+            issues = await asyncio.to_thread(agent.github.fetch_incident_issues, True)
+            if issues is None:
+                print("✅ No changes since last check (304).")
+                if failed:
+                    print(f"🔁 Retrying failed incident(s): {sorted(failed)}")
+                    for issue in list(failed.values()):
+                        submit(issue)
+            else:
+                # the fresh listing is authoritative; anything still open is resubmitted below
+                failed.clear()
+                new_issues = [i for i in issues if i["number"] not in processed]
+                if not new_issues:
+                    print("✅ No new incidents.")
+                else:
+                    print(f"🚨 Found {len(new_issues)} new incident(s): {[i['number'] for i in new_issues]}")
+                    for issue in new_issues:
+                        submit(issue, issues)
         except Exception as e:
             print(f"⚠️ Agent loop error: {e}")
 
         print(f"🕒 Sleeping for {POLL_INTERVAL}s...\n")
-        time.sleep(POLL_INTERVAL)
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def main():
+    print("🤖 Starting Agentic L1/L2 Support Assistant (Continuous Mode)...")
+    agent = L1L2SupportAgent()
+    processed = load_processed()
+    pending = set()
+    failed = {}  # number -> issue whose last triage raised
+    queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    def submit(issue, all_issues=None):
+        # Runs on the loop thread only; webhook and poller may both see the same issue.
+        # The poller passes its listing along so triage need not fetch it again.
+        if issue["number"] in processed or issue["number"] in pending:
+            return
+        pending.add(issue["number"])
+        queue.put_nowait((issue, all_issues))
+
+    if WEBHOOK_PORT:
+        start_webhook_server(WEBHOOK_PORT, lambda issue: loop.call_soon_threadsafe(submit, issue))
+
+    # Bounded worker pool: up to MAX_CONCURRENT_TRIAGE issues are triaged at once
+    await asyncio.gather(
+        *(triage_worker(agent, queue, processed, pending, failed) for _ in range(MAX_CONCURRENT_TRIAGE)),
+        poll_loop(agent, submit, processed, failed),
+    )
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -8,8 +8,20 @@ Unified helper for Agentic L1/L2 triage reasoning using Gemini models.
 """
 
 import os
+import re
 import google.generativeai as genai
 
+# Prompt windows: the tail of an issue holds the latest logs, the head of a KB
+# article holds its summary; both bound input tokens (latency and cost)
+BODY_WINDOW = 4096
+KB_WINDOW = 2048
+
+# One pass over the model output instead of four startswith checks per line
+_FIELD_RE = re.compile(
+    r"^[ \t]*(severity|probable cause|recommended fix|resolution time)[ \t]*:[ \t]*(.*?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
 
 class DSPyHelper:
     def __init__(self, primary_model="gemini-2.5-flash", fallback_model="gemini-1.5-pro"):
@@ -28,6 +40,8 @@ class DSPyHelper:
     # ------------------------------------------------------------------ #
     def build_prompt(self, title: str, body: str, kb: str) -> str:
         """Rich reasoning instruction prompt with example."""
+        body = (body or "")[-BODY_WINDOW:]
+        kb = (kb or "")[:KB_WINDOW]
         return f"""
 You are an experienced Site Reliability Engineer performing incident triage.
 
@@ -65,21 +79,30 @@ Resolution Time: <estimate like '30m', '2h', '1 day'>
         prompt = self.build_prompt(title, body, kb)
 
         text = self._generate(prompt, self.primary)
-        if not text or "[Empty" in text or text.startswith("[Gemini error"):
+        if self._failed(text):
             print("⚠️ Retrying with fallback model:", self.fallback_model_name)
             text = self._generate(prompt, self.fallback)
+        return self._parse_fields(text)
 
+    async def arun_reasoning(self, title: str, body: str, kb: str, timestamp: str) -> dict:
+        """Async variant of run_reasoning; lets triage of several issues overlap."""
+        prompt = self.build_prompt(title, body, kb)
+
+        text = await self._agenerate(prompt, self.primary)
+        if self._failed(text):
+            print("⚠️ Retrying with fallback model:", self.fallback_model_name)
+            text = await self._agenerate(prompt, self.fallback)
+        return self._parse_fields(text)
+
+    @staticmethod
+    def _failed(text: str) -> bool:
+        return not text or "[Empty" in text or text.startswith("[Gemini error")
+
+    @staticmethod
+    def _parse_fields(text: str) -> dict:
         fields = {"severity": "", "probable_cause": "", "recommended_fix": "", "resolution_time": ""}
-        for line in text.splitlines():
-            l = line.strip()
-            if l.lower().startswith("severity:"):
-                fields["severity"] = l.split(":", 1)[1].strip()
-            elif l.lower().startswith("probable cause:"):
-                fields["probable_cause"] = l.split(":", 1)[1].strip()
-            elif l.lower().startswith("recommended fix:"):
-                fields["recommended_fix"] = l.split(":", 1)[1].strip()
-            elif l.lower().startswith("resolution time:"):
-                fields["resolution_time"] = l.split(":", 1)[1].strip()
+        for m in _FIELD_RE.finditer(text):
+            fields[m.group(1).lower().replace(" ", "_")] = m.group(2)
 
         print("\n🧩 Raw Gemini Output:\n", text, "\n")
         return fields
@@ -87,24 +110,45 @@ Resolution Time: <estimate like '30m', '2h', '1 day'>
     # ------------------------------------------------------------------ #
     # Internal generation util
     # ------------------------------------------------------------------ #
+    GENERATION_CONFIG = {
+        "temperature": 0.2,  # fixed four-line schema; low temperature parses reliably
+        # 2.5-series thinking tokens count against this cap; leave room for them
+        # plus the four-line answer or the call ends in MAX_TOKENS with no text
+        "max_output_tokens": 1024,
+        "top_p": 0.9,
+    }
+
     def _generate(self, prompt: str, model) -> str:
         """Low-level Gemini call with safe parsing."""
         try:
             resp = model.generate_content(
                 contents=[{"role": "user", "parts": [{"text": prompt}]}],
-                generation_config={
-                    "temperature": 0.8,
-                    "max_output_tokens": 2048,
-                    "top_p": 0.9,
-                },
+                generation_config=self.GENERATION_CONFIG,
             )
+            return self._response_text(resp)
+        except Exception as e:
+            return f"[Gemini error: {e}]"
 
-            # Extract text safely
-            if hasattr(resp, "text") and resp.text:
-                return resp.text.strip()
-            if hasattr(resp, "candidates") and resp.candidates:
-                parts = resp.candidates[0].content.parts
-                return "\n".join([p.text for p in parts if hasattr(p, "text")]).strip()
-            return str(resp)
+    async def _agenerate(self, prompt: str, model) -> str:
+        """Non-blocking _generate via generate_content_async."""
+        try:
+            resp = await model.generate_content_async(
+                contents=[{"role": "user", "parts": [{"text": prompt}]}],
+                generation_config=self.GENERATION_CONFIG,
+            )
+            return self._response_text(resp)
         except Exception as e:
             return f"[Gemini error: {e}]"
+
+    @staticmethod
+    def _response_text(resp) -> str:
+        # Extract text safely; .text raises ValueError when the candidate has no text parts
+        try:
+            if resp.text:
+                return resp.text.strip()
+        except (AttributeError, ValueError):
+            pass
+        if getattr(resp, "candidates", None):
+            parts = resp.candidates[0].content.parts
+            return "\n".join([p.text for p in parts if hasattr(p, "text")]).strip()
+        return str(resp)
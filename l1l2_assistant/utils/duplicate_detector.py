@@ -1,36 +1,32 @@
 import os
 import numpy as np
 import google.generativeai as genai
+from utils.embed_cache import get_embed_cache, unit_rows
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+EMBED_MODEL = "models/embedding-001"
+EMBED_DIM = 768
+EMBED_BATCH = 100  # max texts per embed_content request
+
+def issue_text(issue: dict) -> str:
+    return f"{issue.get('title', '')}\n{issue.get('body', '')}"
+
 def embed_text(text: str) -> np.ndarray:
-    try:
-        res = genai.embed_content(model="models/embedding-001", content=text)
-        return np.array(res["embedding"], dtype=np.float32)
-    except Exception as e:
-        print(f"⚠️ Embedding failed: {e}")
-        return np.zeros(768, dtype=np.float32)
+    return embed_texts([text])[0]
 
-def cosine_similarity(a, b):
-    if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
-        return 0.0
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+def embed_texts(texts: list) -> np.ndarray:
+    """Embed many texts (disk-cached); returns an (N, 768) matrix of unit vectors."""
+    return unit_rows(get_embed_cache().get_or_compute_many(texts, EMBED_MODEL, _embed_batch))
 
-def find_similar_issues(new_issue, all_issues, threshold=0.85):
-    """Detect similar issues semantically"""
-    query_vec = embed_text(f"{new_issue.get('title', '')}\n{new_issue.get('body', '')}")
-    matches = []
-    for issue in all_issues:
-        if issue["number"] == new_issue["number"]:
-            continue
-        text = f"{issue.get('title', '')}\n{issue.get('body', '')}"
-        vec = embed_text(text)
-        score = cosine_similarity(query_vec, vec)
-        if score >= threshold:
-            matches.append({
-                "number": issue["number"],
-                "title": issue["title"],
-                "score": round(score, 3)
-            })
-    return matches
+def _embed_batch(texts: list) -> np.ndarray:
+    """One Gemini request per EMBED_BATCH texts; failed chunks stay zero."""
+    out = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+    for start in range(0, len(texts), EMBED_BATCH):
+        chunk = texts[start:start + EMBED_BATCH]
+        try:
+            res = genai.embed_content(model=EMBED_MODEL, content=chunk)
+            out[start:start + len(chunk)] = np.asarray(res["embedding"], dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Embedding failed: {e}")
+    return out
@@ -0,0 +1,95 @@
+"""
+EmbedCache
+----------
+Content-addressed on-disk cache for embeddings (sqlite, one row per vector).
+Key = blake3(model + "\\0" + text) — sha256 when blake3 is not installed.
+Value = raw float32 bytes. Unchanged issues / KB files are never re-embedded.
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+try:
+    from blake3 import blake3 as _hash
+except ImportError:
+    _hash = hashlib.sha256
+
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".embed_cache.db")
+
+
+def unit_rows(M: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so cosine similarity is a plain dot product; zero rows stay zero."""
+    return M / (np.linalg.norm(M, axis=-1, keepdims=True) + 1e-12)
+
+
+def cache_key(model: str, text: str) -> str:
+    return _hash(f"{model}\0{text}".encode()).hexdigest()
+
+
+class EmbedCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+            self._conn.commit()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update({k: np.frombuffer(v, dtype=np.float32) for k, v in rows})
+        return found
+
+    def put_many(self, items: list):
+        """items: (key, vector) pairs."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items],
+            )
+            self._conn.commit()
+
+    def get_or_compute_many(self, texts: list, model: str, compute) -> np.ndarray:
+        """
+        Return an (N, d) matrix for `texts`; only cache misses are passed to
+        `compute(list_of_texts) -> (M, d) array`. All-zero rows (failed
+        embeddings) are returned but not stored.
+        """
+        keys = [cache_key(model, t) for t in texts]
+        cached = self.get_many(list(dict.fromkeys(keys)))
+
+        missing = list(dict.fromkeys(k for k in keys if k not in cached))
+        if missing:
+            first_text = {}
+            for k, t in zip(keys, texts):
+                first_text.setdefault(k, t)
+            vecs = np.asarray(compute([first_text[k] for k in missing]), dtype=np.float32)
+            fresh = dict(zip(missing, vecs))
+            self.put_many([(k, v) for k, v in fresh.items() if v.any()])
+            cached.update(fresh)
+
+        return np.stack([cached[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def get_or_compute(self, text: str, model: str, compute) -> np.ndarray:
+        return self.get_or_compute_many([text], model, compute)[0]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_embed_cache() -> EmbedCache:
+    """Process-wide cache shared by similarity.py and duplicate_detector.py."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = EmbedCache()
+        return _default
@@ -1,6 +1,25 @@
 import os
 import json
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+PER_PAGE = 100  # GitHub's maximum; the default of 30 silently truncated listings
+PAGE_WORKERS = 8
+
+
+def issue_digest(issue: dict) -> str:
+    """Hash of the issue's title and body. Unlike updated_at it ignores comments,
+    labels and reactions, so only a real edit makes a cached triage stale."""
+    text = f"{issue.get('title', '')}\n{issue.get('body') or ''}"
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
 
 class GitHubHelper:
     """GitHub helper: fetch issues, comments, and post comments.
@@ -13,54 +32,155 @@ class GitHubHelper:
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github+json"
         }
+        # One keep-alive pool for every GitHub call; GETs back off on 429/5xx
+        # (POST is not retried by urllib3's default allowed_methods, so no double comments)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+        ))
         self.cache_file = cache_file
         self.cache = self._load_cache()
+        self._cache_lock = threading.Lock()  # triage runs concurrently across issues
+        self._vec_index = None  # (issue numbers, unit-vector matrix) built lazily from the cache
+        # Last incident listing + its ETag; a 304 on If-None-Match is free (no rate-limit cost)
+        self._issues_etag = None
+        self._issues = []
 
     def _load_cache(self):
+        """{"triaged": {"<issue number>": {"comment": str, "fields": {...}, "ts": iso, "digest": str, "vec": base64 float32}}}"""
+        cache = {"triaged": {}}
         if os.path.exists(self.cache_file):
             try:
-                return json.load(open(self.cache_file, "r"))
+                cache = json.load(open(self.cache_file, "r"))
             except Exception:
-                return {"triaged": []}
-        return {"triaged": []}
+                pass
+        if isinstance(cache.get("triaged"), list):
+            # Legacy format: ["issue-12", ...]
+            cache["triaged"] = {k.removeprefix("issue-"): {} for k in cache["triaged"]}
+        return cache
+
+    def is_triaged(self, issue_number: int, digest: str = None) -> bool:
+        """True if triaged and, when `digest` (issue_digest) is given, title/body are unchanged since."""
+        entry = self.cache["triaged"].get(str(issue_number))
+        if entry is None:
+            return False
+        return digest is None or entry.get("digest", digest) == digest
+
+    def _mark_triaged(self, issue_number: int, fields: dict = None, vec=None, comment: str = None, ts: str = None,
+                      digest: str = None):
+        entry = {}
+        if comment:
+            entry["comment"] = comment
+        if ts:
+            entry["ts"] = ts
+        if digest:
+            entry["digest"] = digest
+        if fields:
+            entry["fields"] = fields
+        if vec is not None and np.any(vec):
+            entry["vec"] = base64.b64encode(np.asarray(vec, dtype=np.float32).tobytes()).decode()
+        with self._cache_lock:
+            self.cache["triaged"].setdefault(str(issue_number), {}).update(entry)
+            if "vec" in entry:
+                self._vec_index = None
+            self._save_cache()
+
+    def find_cached_triage(self, vec, threshold: float, exclude: int = None):
+        """Semantic cache lookup: (issue number, fields, score) of the closest triaged issue, or None."""
+        with self._cache_lock:
+            if self._vec_index is None:
+                entries = [(k, e) for k, e in self.cache["triaged"].items() if "vec" in e and "fields" in e]
+                nums = [int(k) for k, _ in entries]
+                M = np.array([np.frombuffer(base64.b64decode(e["vec"]), dtype=np.float32) for _, e in entries])
+                self._vec_index = (nums, M)
+            nums, M = self._vec_index
+        if not nums or not np.any(vec):
+            return None
+        scores = M @ vec
+        if exclude is not None and exclude in nums:
+            scores[nums.index(exclude)] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return nums[best], self.cache["triaged"][str(nums[best])]["fields"], float(scores[best])
 
     def _save_cache(self):
         with open(self.cache_file, "w") as f:
             json.dump(self.cache, f, indent=2)
 
-    def fetch_incident_issues(self):
-        url = f"https://api.github.com/repos/{self.repo}/issues?labels=incident&state=open"
-        r = requests.get(url, headers=self.headers)
+    def fetch_incident_issues(self, only_if_changed: bool = False):
+        """Open incident issues, revalidated with the last ETag.
+
+        On HTTP 304 the previous listing is returned, or None when
+        only_if_changed is set so pollers can skip the cycle entirely.
+        """
+        url = f"https://api.github.com/repos/{self.repo}/issues?labels=incident&state=open&per_page={PER_PAGE}"
+        # The ETag covers page 1, where new incidents land
+        headers = {"If-None-Match": self._issues_etag} if self._issues_etag else {}
+        r = self.session.get(url, headers=headers)
+        if r.status_code == 304:
+            return None if only_if_changed else self._issues
         r.raise_for_status()
-        return r.json()
+        self._issues_etag = r.headers.get("ETag")
+        self._issues = self._all_pages(r)
+        return self._issues
+
+    def _all_pages(self, first):
+        """Concatenate every page of a listing; pages 2..last are fetched in parallel."""
+        items = first.json()
+        last = first.links.get("last", {}).get("url")
+        if not last:
+            return items
+        parsed = urlparse(last)
+        query = parse_qs(parsed.query)
+        n_pages = int(query["page"][0])
+
+        def page(n):
+            q = urlencode({**query, "page": [str(n)]}, doseq=True)
+            r = self.session.get(parsed._replace(query=q).geturl())
+            r.raise_for_status()
+            return r.json()
+
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as ex:
+            for chunk in ex.map(page, range(2, n_pages + 1)):
+                items.extend(chunk)
+        return items
 
     def _get_comments(self, issue_number: int):
-        url = f"https://api.github.com/repos/{self.repo}/issues/{issue_number}/comments"
-        r = requests.get(url, headers=self.headers)
+        url = f"https://api.github.com/repos/{self.repo}/issues/{issue_number}/comments?per_page={PER_PAGE}"
+        r = self.session.get(url)
         r.raise_for_status()
-        return r.json()
+        return self._all_pages(r)
 
-    def comment_issue_once(self, issue_number: int, body: str):
-        """Post comment only once: checks cache and existing comments."""
-        issue_key = f"issue-{issue_number}"
-        if issue_key in self.cache["triaged"]:
+    def comment_issue_once(self, issue_number: int, body: str, fields: dict = None, vec=None, digest: str = None):
+        """Post comment only once: checks cache and existing comments.
+        The posted body, `fields` and `vec` are cached so restarts and near-duplicate
+        issues can reuse them. An issue whose title/body `digest` changed since its
+        cached triage is re-triaged; new comments or labels alone do not count.
+        """
+        if self.is_triaged(issue_number, digest):
             print(f"Skipping #{issue_number}: already in local cache.")
             return False
 
-        comments = self._get_comments(issue_number)
-        if any("Agentic L1/L2 Triage Summary" in c["body"] for c in comments):
-            print(f"Skipping #{issue_number}: triage comment already exists on GitHub.")
-            self.cache["triaged"].append(issue_key)
-            self._save_cache()
-            return False
+        if str(issue_number) not in self.cache["triaged"]:
+            comments = self._get_comments(issue_number)
+            existing = [c for c in comments if "Agentic L1/L2 Triage Summary" in c["body"]]
+            if existing:
+                print(f"Skipping #{issue_number}: triage comment already exists on GitHub.")
+                self._mark_triaged(
+                    issue_number, comment=existing[-1]["body"], ts=existing[-1]["created_at"], digest=digest
+                )
+                return False
 
         url = f"https://api.github.com/repos/{self.repo}/issues/{issue_number}/comments"
-        r = requests.post(url, headers=self.headers, json={"body": body})
+        r = self.session.post(url, json={"body": body})
         if r.status_code >= 400:
             print(f"Failed to post comment on #{issue_number}: {r.status_code} {r.text}")
             return False
 
-        self.cache["triaged"].append(issue_key)
-        self._save_cache()
+        self._mark_triaged(issue_number, fields, vec, comment=body, ts=r.json().get("created_at"), digest=digest)
         print(f"Posted triage comment on #{issue_number}")
         return True
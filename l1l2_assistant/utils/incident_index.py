@@ -0,0 +1,123 @@
+"""
+IncidentIndex
+-------------
+Persistent nearest-neighbour index over every incident ever triaged, used for
+duplicate detection. hnswlib (HNSW graph, ~O(log N) queries) when installed,
+otherwise an exact numpy matmul over the IncidentStore, which then holds the
+only copy of the ids and vectors. Labels are GitHub issue numbers; titles are
+kept alongside for the comment.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+from utils.incident_store import get_incident_store
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+INDEX_PATH = ".incident_index.bin"
+IDS_PATH = ".incident_ids.npy"
+TITLES_PATH = ".incident_titles.json"
+DIM = 768
+INITIAL_CAPACITY = 1024
+
+
+class IncidentIndex:
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.titles = json.load(open(TITLES_PATH)) if os.path.exists(TITLES_PATH) else {}
+
+        self._hnsw, self._store = None, None
+        if hnswlib:
+            self.ids = [int(n) for n in np.load(IDS_PATH)] if os.path.exists(IDS_PATH) else []
+            self._hnsw = hnswlib.Index(space="cosine", dim=dim)
+            capacity = max(INITIAL_CAPACITY, 2 * len(self.ids))
+            if self.ids and os.path.exists(INDEX_PATH):
+                self._hnsw.load_index(INDEX_PATH, max_elements=capacity)
+            else:
+                self.ids = []
+                self._hnsw.init_index(max_elements=capacity, ef_construction=200, M=16)
+            self._hnsw.set_ef(64)
+        else:
+            self._store = get_incident_store()
+            self.ids = [int(n) for n in self._store.ids]
+        self._pos = {n: i for i, n in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, number):
+        return number in self._pos
+
+    def title(self, number: int) -> str:
+        return self.titles.get(str(number), "")
+
+    def add_many(self, numbers: list, vecs, titles: list):
+        """Insert or replace vectors (unit-length) for the given issue numbers."""
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(-1, self.dim)
+        keep = [i for i, v in enumerate(vecs) if v.any()]  # failed (all-zero) embeddings
+        numbers, titles, vecs = [numbers[i] for i in keep], [titles[i] for i in keep], vecs[keep]
+        if not numbers:
+            return
+        with self._lock:
+            new = [n for n in dict.fromkeys(numbers) if n not in self._pos]
+            if self._hnsw is not None:
+                needed = len(self.ids) + len(new)
+                if needed > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(2 * needed)
+                self._hnsw.add_items(vecs, numbers)  # existing labels are updated in place
+            else:
+                self._store.add_many(numbers, vecs)
+            for n in new:
+                self._pos[n] = len(self.ids)
+                self.ids.append(n)
+            for n, t in zip(numbers, titles):
+                self.titles[str(n)] = t
+
+    def add(self, number: int, vec, title: str):
+        self.add_many([number], [vec], [title])
+
+    def query(self, vec, k: int = 10, threshold: float = 0.85, exclude: int = None) -> list:
+        """Top-k (issue_number, cosine score) pairs with score >= threshold."""
+        with self._lock:
+            if not self.ids or not np.any(vec):
+                return []
+            n = min(k + 1, len(self.ids))  # +1 so excluding the query issue still leaves k
+            if self._hnsw is not None:
+                labels, dists = self._hnsw.knn_query(np.asarray(vec, dtype=np.float32), k=n)
+                pairs = zip(labels[0], 1.0 - dists[0])
+            else:
+                ids, M = self._store.matrix(self.ids)
+                scores = M @ vec
+                top = np.argsort(-scores)[:n]
+                pairs = ((ids[i], scores[i]) for i in top)
+            hits = [(int(num), float(s)) for num, s in pairs if num != exclude and s >= threshold]
+        return hits[:k]
+
+    def save(self):
+        with self._lock:
+            if self._hnsw is not None:
+                np.save(IDS_PATH, np.array(self.ids, dtype=np.int64))
+                self._hnsw.save_index(INDEX_PATH)
+            else:
+                self._store.save()
+            with open(TITLES_PATH, "w") as f:
+                json.dump(self.titles, f)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_incident_index() -> IncidentIndex:
+    """Process-wide index shared by all concurrent triages."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = IncidentIndex()
+        return _default
@@ -0,0 +1,74 @@
+"""
+IncidentStore
+-------------
+Persistent issue_number -> unit embedding map (np.savez: ids int32[N],
+vecs float32[N, 768]). Issues are embedded once; similarity against every
+stored incident is then a single matmul.
+"""
+
+import os
+import threading
+import numpy as np
+
+STORE_PATH = ".incident_store.npz"
+DIM = 768
+
+
+class IncidentStore:
+    def __init__(self, path: str = STORE_PATH, dim: int = DIM):
+        self.path = path
+        self._lock = threading.Lock()
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.vecs = np.zeros((0, dim), dtype=np.float32)
+        if os.path.exists(path):
+            with np.load(path) as z:
+                self.ids, self.vecs = z["ids"], z["vecs"]
+        self._pos = {int(n): i for i, n in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, number):
+        return number in self._pos
+
+    def add_many(self, numbers: list, vecs):
+        """Insert or replace unit vectors; all-zero (failed) embeddings are ignored."""
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(len(numbers), -1)
+        with self._lock:
+            fresh_ids, fresh_vecs = [], []
+            for n, v in zip(numbers, vecs):
+                if not v.any():
+                    continue
+                if n in self._pos:
+                    self.vecs[self._pos[n]] = v
+                elif n not in fresh_ids:
+                    self._pos[n] = len(self.ids) + len(fresh_ids)
+                    fresh_ids.append(n)
+                    fresh_vecs.append(v)
+            if fresh_ids:
+                self.ids = np.concatenate([self.ids, np.array(fresh_ids, dtype=np.int32)])
+                self.vecs = np.vstack([self.vecs, np.stack(fresh_vecs)])
+
+    def matrix(self, numbers: list = None):
+        """(ids, vecs) for the given issue numbers that are stored, or for everything."""
+        with self._lock:
+            if numbers is None:
+                return self.ids, self.vecs
+            rows = [self._pos[n] for n in numbers if n in self._pos]
+            return self.ids[rows], self.vecs[rows]
+
+    def save(self):
+        with self._lock:
+            np.savez(self.path, ids=self.ids, vecs=self.vecs)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_incident_store() -> IncidentStore:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = IncidentStore()
+        return _default
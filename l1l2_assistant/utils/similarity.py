@@ -1,26 +1,108 @@
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import requests
 import google.generativeai as genai
+from utils.embed_cache import get_embed_cache, unit_rows
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+EMBED_MODEL = "models/embedding-001"
+EMBED_BATCH = 100  # max texts per embed_content request
+KB_FETCH_WORKERS = 16
+KB_INDEX_PATH = os.getenv("KB_INDEX_PATH", "kb_embeddings.npz")
+
+# Triage fields a KB article can pre-declare, in YAML front matter or a "## Triage" section
+_KB_FRONT_MATTER = re.compile(r"\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+_KB_TRIAGE_SECTION = re.compile(r"^##[ \t]+Triage[ \t]*\n(.*?)(?=^#|\Z)", re.DOTALL | re.MULTILINE | re.IGNORECASE)
+_KB_FIELD = re.compile(
+    r"^[ \t]*[-*]?[ \t]*\**(severity|probable[ _]cause|recommended[ _]fix|resolution[ _]time)\**[ \t]*:\**[ \t]*(.+?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# sha -> (unit vector, content); GitHub blob SHAs are content-addressed, so an
+# unchanged article is never downloaded or embedded again
+_kb_index = None
+_kb_lock = threading.Lock()
+
 def embed_text(text: str) -> np.ndarray:
-    """Generate Gemini embeddings for text."""
-    res = genai.embed_content(model="models/embedding-001", content=text)
-    return np.array(res["embedding"], dtype=np.float32)
+    """Generate a unit-length Gemini embedding for text (disk-cached by content)."""
+    return unit_rows(get_embed_cache().get_or_compute(text, EMBED_MODEL, _embed_batch))
+
+def embed_texts(texts: list) -> np.ndarray:
+    return unit_rows(get_embed_cache().get_or_compute_many(texts, EMBED_MODEL, _embed_batch))
+
+def _embed_batch(texts: list) -> np.ndarray:
+    vecs = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        res = genai.embed_content(model=EMBED_MODEL, content=texts[start:start + EMBED_BATCH])
+        vecs.extend(res["embedding"])
+    return np.asarray(vecs, dtype=np.float32)
+
+def kb_triage_fields(content: str) -> dict:
+    """Triage fields declared by a KB article, or {} if it has no usable template."""
+    blocks = [m.group(1) for m in (_KB_FRONT_MATTER.search(content or ""), _KB_TRIAGE_SECTION.search(content or "")) if m]
+    fields = {}
+    for block in blocks:
+        for m in _KB_FIELD.finditer(block):
+            key = re.sub(r"[ _]+", "_", m.group(1).lower())
+            fields.setdefault(key, m.group(2).strip().strip("\"'"))
+    return fields if {"severity", "recommended_fix"} <= fields.keys() else {}
 
-def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
-        return 0.0
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+def _load_kb_index() -> dict:
+    global _kb_index
+    if _kb_index is None:
+        _kb_index = {}
+        if os.path.exists(KB_INDEX_PATH):
+            try:
+                with np.load(KB_INDEX_PATH) as z:
+                    _kb_index = {
+                        str(sha): (vec, str(content))
+                        for sha, vec, content in zip(z["sha"], z["vec"], z["content"])
+                    }
+            except Exception as e:
+                print(f"⚠️ KB index load error: {e}")
+    return _kb_index
+
+def _save_kb_index(index: dict):
+    shas = list(index)
+    np.savez(
+        KB_INDEX_PATH,
+        sha=np.array(shas, dtype=str),
+        vec=np.stack([index[s][0] for s in shas]) if shas else np.zeros((0, 0), dtype=np.float32),
+        content=np.array([index[s][1] for s in shas], dtype=str),
+    )
+
+def _refresh_kb_index(md_files: list, headers: dict) -> dict:
+    """Download + embed only articles whose blob SHA is not indexed yet; drop deleted ones."""
+    with _kb_lock:
+        index = _load_kb_index()
+        missing = [f for f in md_files if f["sha"] not in index]
+        live = {f["sha"] for f in md_files}
+        stale = [sha for sha in index if sha not in live]
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=KB_FETCH_WORKERS) as ex:
+                contents = list(ex.map(
+                    lambda f: requests.get(f["download_url"], headers=headers, timeout=10).text, missing
+                ))
+            M = embed_texts(contents)
+            for f, vec, content in zip(missing, M, contents):
+                index[f["sha"]] = (vec, content)
+
+        for sha in stale:
+            del index[sha]
+        if missing or stale:
+            _save_kb_index(index)
+        return index
 
 def find_relevant_kb(query: str, kb_repo: str, github_token: str, kb_path: str = "knowledge") -> dict:
     """
     Fetch all Markdown KB files from a specific folder (e.g., /knowledge)
     in a GitHub repo and return the best semantic match.
     """
-    query_vec = embed_text(query)
     best_score, best_name, best_content, best_url = 0.0, None, None, None
 
     headers = {"Authorization": f"token {github_token}"} if github_token else {}
@@ -31,19 +113,18 @@ def find_relevant_kb(query: str, kb_repo: str, github_token: str, kb_path: str =
     try:
         resp = requests.get(base_api, headers=headers, timeout=10)
         resp.raise_for_status()
-        items = resp.json()
-
-        for file in items:
-            if not file["name"].endswith(".md"):
-                continue
-
-            raw_content = requests.get(file["download_url"], headers=headers, timeout=10).text
-            vec = embed_text(raw_content)
-            score = cosine_similarity(query_vec, vec)
-            if score > best_score:
-                best_score = score
-                best_name, best_content = file["name"], raw_content
-                best_url = f"{base_blob}/{file['name']}"
+        md_files = [f for f in resp.json() if f["name"].endswith(".md")]
+        index = _refresh_kb_index(md_files, headers)
+
+        if md_files:
+            q = embed_text(query)
+            M = np.stack([index[f["sha"]][0] for f in md_files])
+            scores = M @ q
+            best = int(np.argmax(scores))
+            if scores[best] > 0:
+                best_score = float(scores[best])
+                best_name, best_content = md_files[best]["name"], index[md_files[best]["sha"]][1]
+                best_url = f"{base_blob}/{best_name}"
 
     except Exception as e:
         print(f"⚠️ KB fetch error: {e}")
@@ -1,8 +1,139 @@
 import os
+import re
+import atexit
+import sys
+import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
+import orjson
 import dspy
 from dspy import Prediction
 from agenspy import RealMCPClient
+from shared.config import configure_lm, load_saved_state
+from shared.llm_cache import DiskCache
+
+# PR fetches are cached on disk; a URL pinned to a commit never changes, an
+# open PR is refetched once the entry is older than MCP_CACHE_TTL.
+MCP_CACHE_TTL = int(os.getenv("MCP_CACHE_TTL", "3600"))
+_COMMIT_URL = re.compile(r"/commit/[0-9a-f]{40}$")
+
+# Input token budgets per field; a real diff can be megabytes
+DIFF_TOKEN_BUDGET = 6000
+CONTEXT_TOKEN_BUDGET = 6000
+_DIFF_FILE = re.compile(r"(?=^diff --git )", re.MULTILINE)
+
+# Report fallbacks when the model leaves a field empty (copied to a list only when used)
+_DEFAULT_SECURITY = ("No security issues identified in the current codebase",)
+_DEFAULT_EDGE_CASES = ("No potential edge cases detected",)
+_DEFAULT_DOC_UPDATES = ("No documentation updates required",)
+_DEFAULT_DOC_SUGGESTIONS = ("Documentation appears to be complete",)
+_DEFAULT_IMPACT = "No significant impact detected"
+
+# Pin a version (e.g. "@modelcontextprotocol/server-github@2025.4.8") to let npx skip the registry lookup
+MCP_SERVER_PACKAGE = os.getenv("MCP_SERVER_PACKAGE", "@modelcontextprotocol/server-github")
+
+_mcp_client = None
+_mcp_lock = threading.Lock()
+
+
+def get_mcp_client() -> RealMCPClient:
+    """Process-wide MCP client: the npx server is spawned once and stopped at exit."""
+    global _mcp_client
+    with _mcp_lock:
+        if _mcp_client is None:
+            _mcp_client = RealMCPClient(["npx", "-y", MCP_SERVER_PACKAGE])
+            # Connect up front so concurrent first calls don't each start a server
+            _mcp_client.connect()
+            atexit.register(_mcp_client.disconnect)
+        return _mcp_client
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """gpt-4o-mini tokenizer, or None when tiktoken/its BPE file is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception:
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    enc = _encoding()
+    return len(enc.encode(text)) if enc else len(text) // 4
+
+
+def _fit_budget(text: str, budget_tokens: int) -> str:
+    """Cut `text` to at most `budget_tokens` tokens (~4 chars/token without tiktoken)."""
+    enc = _encoding()
+    if enc is None:
+        return text[:budget_tokens * 4]
+    tokens = enc.encode(text)
+    return text if len(tokens) <= budget_tokens else enc.decode(tokens[:budget_tokens])
+
+
+def _fit_diff(diff: str, budget_tokens: int) -> str:
+    """Keep whole per-file hunks, smallest first, so big generated files are what gets dropped."""
+    if _count_tokens(diff) <= budget_tokens:
+        return diff
+    files = [f for f in _DIFF_FILE.split(diff) if f]
+    sized = sorted(((_count_tokens(f), i) for i, f in enumerate(files)))
+    keep, used = set(), 0
+    for n, i in sized:
+        if used + n > budget_tokens:
+            break
+        keep.add(i)
+        used += n
+    if not keep:
+        return _fit_budget(diff, budget_tokens)
+    omitted = len(files) - len(keep)
+    kept = "".join(f for i, f in enumerate(files) if i in keep)
+    return kept + (f"\n[... {omitted} larger file diff(s) omitted ...]\n" if omitted else "")
+
+
+def _context_text(context) -> str:
+    """PR context as `- key: value` lines with compact JSON values; JSON strings are parsed first.
+    Saves the prompt tokens that pretty-printed JSON punctuation costs."""
+    if isinstance(context, str):
+        try:
+            context = orjson.loads(context)
+        except orjson.JSONDecodeError:
+            return context
+    if isinstance(context, str):
+        return context
+    if isinstance(context, dict):
+        return "\n".join(
+            f"- {k}: {v if isinstance(v, str) else orjson.dumps(v, default=str).decode()}"
+            for k, v in context.items()
+        )
+    return orjson.dumps(context, default=str).decode()
+
+
+class PRReview(dspy.Signature):
+    """Review a pull request for security issues, edge cases, documentation gaps and impact."""
+
+    pr_content: str = dspy.InputField(desc="PR metadata and context")
+    changes: str = dspy.InputField(desc="unified diff of the PR")
+    # Prose first: it is the field astream() shows token by token
+    impact_analysis: str = dspy.OutputField(desc="one short paragraph on what the change affects")
+    security_issues: list[str] = dspy.OutputField(desc="security problems introduced by the change, empty if none")
+    edge_cases: list[str] = dspy.OutputField(desc="inputs or states the change may mishandle")
+    doc_updates: list[str] = dspy.OutputField(desc="docs that must change along with the code")
+    doc_suggestions: list[str] = dspy.OutputField(desc="optional documentation improvements")
+    risk_score: float = dspy.OutputField(desc="0.0 (trivial) to 1.0 (high risk)")
+
+
+# Default adapter: outputs come back as one JSON object (structured outputs where the
+# model supports them), so fields map 1:1 instead of being scraped from [[ ## field ## ]]
+# sections. A caller-configured adapter takes precedence.
+_ADAPTER = dspy.JSONAdapter()
+
 
 class PRReviewAgent(dspy.Module):
     """Agent for automated PR reviews."""
@@ -11,106 +142,228 @@ class PRReviewAgent(dspy.Module):
         super().__init__()
         self.mcp_client = mcp_client
         self.github_token = github_token
+        self.fetch_cache = DiskCache(os.getenv("MCP_CACHE_DIR", ".mcp_cache"))
 
-        # Define predictors with modern signature syntax using ->
-        self.analyze_changes = dspy.Predict(
-            "pr_content -> security_issues: list[str], edge_cases: list[str]"
-        )
-        
-        self.review_docs = dspy.Predict(
-            "changes -> doc_updates: list[str], doc_suggestions: list[str]"
-        )
-        
-        self.analyze_impact = dspy.Predict(
-            "changes, codebase -> impact_analysis: str, risk_score: float"
-        )
+        # Single pass → security, docs and impact; the diff and context are sent
+        # once under one prompt prefix instead of three times
+        self.review = dspy.Predict(PRReview)
 
     def forward(self, pr_url: str) -> Prediction:
         """Review a pull request and provide comprehensive analysis."""
-        # print(f"🔍 Reviewing PR: {pr_url}")
-        
-        # Define default values
-        default_security = ["No security issues identified in the current codebase"]
-        default_edge_cases = ["No potential edge cases detected"]
-        default_doc_updates = ["No documentation updates required"]
-        default_doc_suggestions = ["Documentation appears to be complete"]
-        default_impact = "No significant impact detected"
-        default_risk = 0.0
-        
-        # Fetch PR data
-        pr_data = self.mcp_client(
-            context_request=f"Get PR details for {pr_url}",
-            tool_name="get_pull_request",
-            tool_args={"url": pr_url}
-        )
+        return asyncio.run(self.aforward(pr_url))
 
-        # Access the data properly from pr_data
-        context_data = pr_data.get('context_data', {})
-        diff_data = pr_data.get('diff', '') 
+    async def aforward(self, pr_url: str) -> Prediction:
+        """Async review (one LLM round trip); safe to run many concurrently on one loop."""
+        # print(f"🔍 Reviewing PR: {pr_url}")
+        # The MCP client is a blocking JSON-RPC call; keep it off the event loop
+        context_data, diff_data = await asyncio.to_thread(self._fetch_pr, pr_url)
 
         try:
-            # Analyze changes using modern predictor calls
-            analysis = self.analyze_changes(pr_content=context_data)
-            doc_review = self.review_docs(changes=diff_data)
-            impact = self.analyze_impact(
-                changes=diff_data,
-                codebase=context_data
-            )
-
-            # Return a Prediction object with defaults
-            return dspy.Prediction(
-                security_issues=getattr(analysis, 'security_issues', []) or default_security,
-                edge_cases=getattr(analysis, 'edge_cases', []) or default_edge_cases,
-                doc_updates=getattr(doc_review, 'doc_updates', []) or default_doc_updates,
-                doc_suggestions=getattr(doc_review, 'doc_suggestions', []) or default_doc_suggestions,
-                impact_analysis=getattr(impact, 'impact_analysis', '') or default_impact,
-                risk_score=getattr(impact, 'risk_score', 0.0) or default_risk
-            )
+            with dspy.context(adapter=dspy.settings.adapter or _ADAPTER):
+                result = await self.review.acall(pr_content=context_data, changes=diff_data)
+            return self._build_report(result)
         except Exception as e:
             print(f"Analysis error: {str(e)}")
             # Return prediction with default values on error
-            return dspy.Prediction(
-                security_issues=default_security,
-                edge_cases=default_edge_cases,
-                doc_updates=default_doc_updates,
-                doc_suggestions=default_doc_suggestions,
-                impact_analysis=default_impact,
-                risk_score=default_risk
+            return self._build_report(None)
+
+    async def astream(self, pr_url: str):
+        """Review a PR, yielding dspy StreamResponse chunks of the free-text fields as
+        tokens arrive and the final report Prediction last."""
+        listeners = [
+            dspy.streaming.StreamListener(name)
+            for name, field in self.review.signature.output_fields.items()
+            if field.annotation is str
+        ]
+        stream = dspy.streamify(self, stream_listeners=listeners, is_async_program=True)
+        # ChatAdapter's [[ ## field ## ]] markers stream cleanly token by token
+        with dspy.context(adapter=dspy.ChatAdapter()):
+            async for item in stream(pr_url=pr_url):
+                if isinstance(item, (dspy.streaming.StreamResponse, Prediction)):
+                    yield item
+
+    def batch(self, pr_urls: List[str], num_threads: int = 16) -> List[Prediction]:
+        """Review many PRs: parallel MCP fetches, then one DSPy batch over the review predictor."""
+        rows = self._review_inputs(self._fetch_all(pr_urls, num_threads))
+
+        # Failed items come back as None and fall through to the defaults
+        with dspy.context(adapter=dspy.settings.adapter or _ADAPTER):
+            outputs = self.review.batch(
+                [dspy.Example(**inputs).with_inputs(*inputs) for inputs in rows], num_threads=num_threads
             )
+        return [self._build_report(r) for r in outputs]
+
+    async def abatch(self, pr_urls: List[str], poll_interval: float = 30.0) -> List[Prediction]:
+        """Review many PRs through the OpenAI Batch API (half price, separate rate limits).
+
+        Every PR becomes one line of a batch file; results are parsed
+        back with the same JSONAdapter used online. Meant for offline
+        fleet scans where minutes of latency are fine.
+        """
+        from openai import AsyncOpenAI
+
+        lm = dspy.settings.lm
+        provider, _, model = lm.model.partition("/")
+        if provider != "openai":
+            print(f"⚠️ Batch API needs an OpenAI model (got {lm.model}); using DSPy batch instead.")
+            return await asyncio.to_thread(self.batch, pr_urls)
+
+        fetched = await asyncio.to_thread(self._fetch_all, pr_urls)
+        adapter, signature = _ADAPTER, self.review.signature
+        params = {k: v for k, v in lm.kwargs.items() if k in ("temperature", "max_tokens") and v is not None}
+
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": adapter.format(signature, self.review.demos, inputs),
+                    "response_format": {"type": "json_object"},
+                    **params,
+                },
+            })
+            for i, inputs in enumerate(self._review_inputs(fetched))
+        ]
+
+        client = AsyncOpenAI()
+        upload = await client.files.create(file=("pr_review_batch.jsonl", "\n".join(lines).encode()), purpose="batch")
+        job = await client.batches.create(
+            input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        print(f"📦 Submitted batch {job.id} ({len(lines)} requests)")
+        while job.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            job = await client.batches.retrieve(job.id)
 
-def run_pr_agent():
-    """Run PR Review Agent demo."""
+        results = [None] * len(pr_urls)
+        if job.output_file_id:
+            output = await client.files.content(job.output_file_id)
+            for line in output.text.splitlines():
+                row = json.loads(line)
+                try:
+                    content = row["response"]["body"]["choices"][0]["message"]["content"]
+                    results[int(row["custom_id"])] = dspy.Prediction(**adapter.parse(signature, content))
+                except Exception as e:
+                    print(f"Batch item {row['custom_id']} failed: {e}")
+        if job.status != "completed":
+            print(f"⚠️ Batch {job.id} ended as {job.status}; missing items use defaults.")
+
+        return [self._build_report(r) for r in results]
+
+    def _fetch_all(self, pr_urls: List[str], num_threads: int = 16):
+        # MCP fetches are I/O-bound
+        with ThreadPoolExecutor(max_workers=num_threads) as ex:
+            return list(ex.map(self._fetch_pr, pr_urls))
+
+    @staticmethod
+    def _review_inputs(fetched):
+        """Review predictor inputs, one dict per fetched (context, diff) pair."""
+        return [{"pr_content": ctx, "changes": diff} for ctx, diff in fetched]
+
+    def _fetch_pr(self, pr_url: str):
+        """(context_data, diff) for a PR via MCP, served from the fetch cache when fresh."""
+        key = hashlib.sha256(pr_url.encode()).hexdigest()
+        hit = self.fetch_cache.get(key)
+        if hit and (_COMMIT_URL.search(pr_url) or time.time() - hit["ts"] < MCP_CACHE_TTL):
+            pr_data = dspy.Prediction(**hit["data"])
+        else:
+            pr_data = self.mcp_client(
+                context_request=f"Get PR details for {pr_url}",
+                tool_name="get_pull_request",
+                tool_args={"url": pr_url}
+            ) or {}
+            if pr_data:
+                # RealMCPClient returns a dspy.Prediction, which is not JSON-serializable
+                data = pr_data.toDict() if isinstance(pr_data, Prediction) else dict(pr_data)
+                self.fetch_cache.set(key, {"ts": time.time(), "data": data})
+
+        # Access the data properly from pr_data, trimmed to the input token budgets
+        context_data = _fit_budget(_context_text(pr_data.get('context_data', {})), CONTEXT_TOKEN_BUDGET)
+        return context_data, _fit_diff(pr_data.get('diff', '') or '', DIFF_TOKEN_BUDGET)
+
+    @staticmethod
+    def _build_report(result) -> Prediction:
+        """Fill anything missing from the review output with defaults."""
+        return dspy.Prediction(
+            security_issues=getattr(result, 'security_issues', None) or list(_DEFAULT_SECURITY),
+            edge_cases=getattr(result, 'edge_cases', None) or list(_DEFAULT_EDGE_CASES),
+            doc_updates=getattr(result, 'doc_updates', None) or list(_DEFAULT_DOC_UPDATES),
+            doc_suggestions=getattr(result, 'doc_suggestions', None) or list(_DEFAULT_DOC_SUGGESTIONS),
+            impact_analysis=getattr(result, 'impact_analysis', None) or _DEFAULT_IMPACT,
+            risk_score=getattr(result, 'risk_score', None) or 0.0
+        )
+
+def _print_review(result, skip=()):
+    if not skip:
+        print("\n📋 PR Review Results:")
+    for key, value in result.items():
+        if key in skip:
+            continue
+        print(f"\n{key.replace('_', ' ').title()}:")
+        if isinstance(value, list):
+            for item in value:
+                print(f"  - {item}")
+        else:
+            print(f"  {value}")
+
+
+async def _stream_review(agent, pr_url: str):
+    """Print free-text fields as they stream in, then the rest of the report."""
+    streamed, started, held = [], False, ""
+    async for item in agent.astream(pr_url):
+        if isinstance(item, Prediction):
+            _print_review(item, skip=streamed)
+            continue
+        if item.signature_field_name not in streamed:
+            if not streamed:
+                print("\n📋 PR Review Results:")
+            streamed.append(item.signature_field_name)
+            started, held = False, ""
+            print(f"\n{item.signature_field_name.replace('_', ' ').title()}:\n  ", end="")
+        # Hold back trailing whitespace so the separators between fields aren't echoed
+        text = held + item.chunk if started else item.chunk.lstrip()
+        if item.is_last_chunk:
+            print(text.rstrip(), flush=True)
+            continue
+        body = text.rstrip()
+        if body:
+            print(body, end="", flush=True)
+            started = True
+        held = text[len(body):]
+
+
+def run_pr_agent(batch: bool = False):
+    """Run PR Review Agent demo; with batch=True, review PR URLs read from stdin via the Batch API."""
     github_token = os.getenv('GITHUB_TOKEN')
-    openai_key = os.getenv('OPENAI_API_KEY')
-    
-    if not all([github_token, openai_key]):
-        raise EnvironmentError("Please set GITHUB_TOKEN and OPENAI_API_KEY")
+    if not github_token:
+        raise EnvironmentError("Please set GITHUB_TOKEN")
 
-    # Configure DSPy with modern configuration
-    lm = dspy.LM('openai/gpt-4o-mini', api_key=openai_key)
-    dspy.configure(lm=lm)
+    # One LM per process, shared with the other agents in run_agentic_flow
+    configure_lm()
 
     # Setup MCP client
-    mcp_client = RealMCPClient(
-        ["npx", "-y", "@modelcontextprotocol/server-github"]
-    )
+    mcp_client = get_mcp_client()
 
     try:
         # Create and run agent
-        agent = PRReviewAgent(mcp_client, github_token)
-        result = agent("https://github.com/Tejaswan/spring-boot-realworld-example-app/commit/9d968683cb4bad765aeaf0bc5a604849260802bf")
+        agent = load_saved_state(PRReviewAgent(mcp_client, github_token), "pr_agent")
+        if batch:
+            pr_urls = [line.strip() for line in sys.stdin if line.strip()]
+            for pr_url, result in zip(pr_urls, asyncio.run(agent.abatch(pr_urls))):
+                print(f"\n🔗 {pr_url}")
+                _print_review(result)
+            return
 
-        print("\n📋 PR Review Results:")
-        for key, value in result.items():
-            print(f"\n{key.replace('_', ' ').title()}:")
-            if isinstance(value, list):
-                for item in value:
-                    print(f"  - {item}")
-            else:
-                print(f"  {value}")
+        asyncio.run(_stream_review(
+            agent, "https://github.com/Tejaswan/spring-boot-realworld-example-app/commit/9d968683cb4bad765aeaf0bc5a604849260802bf"
+        ))
                 
     except Exception as e:
         print(f"Error during PR review: {str(e)}")
 
 if __name__ == "__main__":
-    run_pr_agent()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="PR Review Agent")
+    parser.add_argument("--batch", action="store_true", help="review PR URLs from stdin via the OpenAI Batch API")
+    run_pr_agent(batch=parser.parse_args().batch)
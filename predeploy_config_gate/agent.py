@@ -3,6 +3,7 @@ import dspy
 from dspy import Prediction
 from shared.config import configure_lm
 from shared.mcp_client import MockMCPClient
+from shared.file_cache import read_text
 
 
 class PreDeployAgent(dspy.Module):
@@ -20,8 +21,7 @@ class PreDeployAgent(dspy.Module):
     def forward(self, manifest_path: str) -> Prediction:
         """Analyze deployment manifest for risky configurations."""
         # Load manifest YAML
-        with open(manifest_path, "r") as f:
-            manifest = f.read()
+        manifest = read_text(manifest_path)
 
         result = self.validate_manifest(manifest_yaml=manifest)
 
@@ -0,0 +1,39 @@
+"""
+Save the DSPy program state of the mock-data agents and the PR reviewer to artifacts/.
+
+The run_* entrypoints load these files when present, so any tuned
+instructions/demos are reused instead of being rebuilt on every start.
+
+Usage (from the project root):
+    python3 scripts/compile_agents.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import ARTIFACTS_DIR, artifact_path, configure_lm
+from shared.mcp_client import MockMCPClient
+from cicd_failure_explainer.agent import CICDLogAgent
+from incident_rca_generator.agent import InfraRCAGeneratorAgent
+from pr_reviewer.agent import PRReviewAgent
+
+
+def main():
+    configure_lm()
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+
+    agents = {
+        "cicd_agent": CICDLogAgent(MockMCPClient()),
+        "rca_agent": InfraRCAGeneratorAgent(MockMCPClient()),
+        "pr_agent": PRReviewAgent(MockMCPClient()),
+    }
+    for name, agent in agents.items():
+        path = artifact_path(name)
+        agent.save(path)
+        print(f"✅ Saved {type(agent).__name__} → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,49 @@
 import os
 import dspy
 
+DEFAULT_MODEL = "openai/gpt-4o-mini"
+# Agent outputs are short structured fields; cap generation instead of using
+# the provider default.
+DEFAULT_MAX_TOKENS = 1024
+
+# Saved DSPy program state (see scripts/compile_agents.py)
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "artifacts")
+
+_configured = False
+
+
+def artifact_path(name):
+    return os.path.join(ARTIFACTS_DIR, f"{name}.json")
+
+
+def load_saved_state(agent, name):
+    """Load previously saved program state into `agent` when an artifact exists."""
+    path = artifact_path(name)
+    if os.path.exists(path):
+        agent.load(path)
+    return agent
+
+
 def configure_lm():
-    """Set up DSPy LM configuration."""
-    openai_key = os.getenv("OPENAI_API_KEY")
-    if not openai_key:
-        raise EnvironmentError("Please set OPENAI_API_KEY")
-    lm = dspy.LM("openai/gpt-4o-mini", api_key=openai_key)
+    """Set up DSPy LM configuration (once per process)."""
+    global _configured
+    if _configured:
+        return
+    model = os.getenv("DSPY_MODEL", DEFAULT_MODEL)
+    provider = model.split("/", 1)[0]
+    key_env = "ANTHROPIC_API_KEY" if provider == "anthropic" else "OPENAI_API_KEY"
+    api_key = os.getenv(key_env)
+    if not api_key:
+        raise EnvironmentError(f"Please set {key_env}")
+
+    # DSPy's ChatAdapter emits the static signature/instructions as the system
+    # message and the dynamic inputs after it, so the prefix is cacheable.
+    # OpenAI caches it automatically; Anthropic needs an explicit marker.
+    extra = {}
+    if provider == "anthropic":
+        extra["cache_control_injection_points"] = [{"location": "message", "role": "system"}]
+
+    max_tokens = int(os.getenv("DSPY_MAX_TOKENS", DEFAULT_MAX_TOKENS))
+    lm = dspy.LM(model, api_key=api_key, cache=True, max_tokens=max_tokens, **extra)
     dspy.configure(lm=lm)
+    _configured = True
@@ -0,0 +1,13 @@
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=32)
+def _read_text(path, mtime):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def read_text(path):
+    """Read a file once and memoize it; the mtime in the key invalidates stale entries."""
+    return _read_text(path, os.path.getmtime(path))
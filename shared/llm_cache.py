@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import hashlib
+import dspy
+
+# cached_call entries older than this are recomputed
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+
+
+class DiskCache:
+    """Tiny on-disk key/value store for LLM responses and MCP fetches (one JSON file per key)."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("LLM_CACHE_DIR", ".llm_cache")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        tmp = self._path(key) + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️  Failed to write cache entry {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def cache_key(signature, inputs, model=None, demos=()) -> str:
+    """Stable sha256 key over the LM model, the predictor signature and demos, and its (normalized) inputs."""
+    normalized = {k: v.strip() if isinstance(v, str) else v for k, v in inputs.items()}
+    blob = json.dumps(
+        {
+            "model": model,
+            "sig": str(signature),
+            "demos": [d.toDict() if hasattr(d, "toDict") else d for d in demos],
+            "inputs": normalized,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def cached_call(predictor, cache, **kwargs):
+    """Run a DSPy predictor, serving repeats from `cache` for up to LLM_CACHE_TTL seconds.
+    Switching DSPY_MODEL or loading compiled demos changes the key."""
+    lm = dspy.settings.lm
+    key = cache_key(predictor.signature, kwargs, getattr(lm, "model", None), predictor.demos)
+    hit = cache.get(key)
+    if hit and "fields" in hit and time.time() - hit.get("ts", 0) < LLM_CACHE_TTL:
+        return dspy.Prediction(**hit["fields"])
+
+    result = predictor(**kwargs)
+    cache.set(key, {"ts": time.time(), "fields": result.toDict()})
+    return result
@@ -0,0 +1,29 @@
+import re
+
+_DIGITS = re.compile(r"\d+")
+_ERROR_HINT = re.compile(r"error|fail|exception|traceback|fatal|panic", re.IGNORECASE)
+
+
+def compress_logs(text: str, max_lines: int = 300) -> str:
+    """
+    Shrink a log blob before it is sent to an LLM.
+    Lines that only differ by numbers (timestamps, ids, counters) collapse to
+    their last occurrence; if still over `max_lines`, error lines are kept
+    first, then the most recent others. Original order is preserved.
+    """
+    if not text:
+        return text
+
+    last = {}
+    for idx, line in enumerate(text.splitlines()):
+        if line.strip():
+            last[_DIGITS.sub("#", line)[:200]] = (idx, line)
+
+    kept = sorted(last.values())
+    if len(kept) > max_lines:
+        errors = [k for k in kept if _ERROR_HINT.search(k[1])][-max_lines:]
+        others = [k for k in kept if not _ERROR_HINT.search(k[1])]
+        room = max_lines - len(errors)
+        kept = sorted(errors + (others[-room:] if room else []))
+
+    return "\n".join(line for _, line in kept)